@@ -29,7 +29,26 @@ import math
 import random
 import os
 import copy
+import time
+import zlib
+import struct
+import gc
+import json
+import argparse
+import ast
+import mmap
+import io
+import marshal
+import zipfile
+import importlib.util
 import datetime
+import tracemalloc
+import tempfile
+import inspect
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+import heapq
+import functools
 from pygame.locals import *
 
 # ╔═══════════════════════════════════════════════════════════════════════════════╗
@@ -40,6 +59,10 @@ TILE = 16
 WIDTH = 256 * SCALE
 HEIGHT = 240 * SCALE
 FPS = 60
+SIM_DT = 1.0 / FPS
+MAX_SIM_STEPS = 5
+SPAWN_MARGIN = 2 * TILE      # enemies are created this far past the right screen edge
+RETIRE_MARGIN = 8 * TILE     # ... and dropped once this far behind the left edge
 
 # SMB1 Physics (converted from NES subpixels)
 GRAVITY = 0.4375
@@ -81,6 +104,18 @@ MARIO_S = PAL[54]
 GOOMBA = PAL[23]
 KOOPA_G = PAL[26]
 
+# Level prerender
+CHUNK_COLS = 16
+CHUNK_W = CHUNK_COLS * TILE
+CHUNK_KEY = (255, 0, 255)
+
+# Parallax layers: (name, scroll factor, count, spacing, period pad, x offset, band top, band height)
+BG_LAYERS = (
+    ("hills", 0.3, 10, 200, 300, -100, HEIGHT - 121, 62),
+    ("bushes", 0.5, 15, 120, 200, -50, HEIGHT - 70, 31),
+    ("clouds", 0.2, 8, 180, 300, -100, 30, 100),
+)
+
 # ╔═══════════════════════════════════════════════════════════════════════════════╗
 # ║ GAME STATE                                                                    ║
 # ╚═══════════════════════════════════════════════════════════════════════════════╝
@@ -121,10 +156,94 @@ THEMES = {
     8: {"name": "DARK LAND", "sky": 13, "ground": 0, "brick": 6, "pipe": 0},
 }
 
+# ╔═══════════════════════════════════════════════════════════════════════════════╗
+# ║ SCRIPTED INPUT                                                                ║
+# ╚═══════════════════════════════════════════════════════════════════════════════╝
+IN_LEFT, IN_RIGHT, IN_JUMP, IN_RUN = 1, 2, 4, 8
+KEY_BITS = {
+    K_LEFT: IN_LEFT, K_a: IN_LEFT,
+    K_RIGHT: IN_RIGHT, K_d: IN_RIGHT,
+    K_SPACE: IN_JUMP, K_z: IN_JUMP, K_UP: IN_JUMP, K_w: IN_JUMP,
+    K_LSHIFT: IN_RUN, K_RSHIFT: IN_RUN, K_x: IN_RUN,
+}
+
+class ScriptedKeys:
+    """Stands in for pygame.key.get_pressed() from an input bitmask"""
+    def __init__(self, mask=0):
+        self.mask = mask
+        
+    def __getitem__(self, key):
+        return self.mask & KEY_BITS.get(key, 0)
+
+def autoplay(frame):
+    """Default script: run right, jumping in a steady rhythm"""
+    return IN_RIGHT | IN_RUN | (IN_JUMP if frame % 48 < 24 else 0)
+
+def mask_from_keys(keys):
+    mask = 0
+    for key, bit in KEY_BITS.items():
+        if keys[key]:
+            mask |= bit
+    return mask
+
+class Replay:
+    """One input bitmask per sim frame, plus the level and player state it started from. With
+    restart set the session went back to that level on every game over and kept recording;
+    archive names the .kpa its levels came from (seed is None for a hand-made archived slot, whose
+    level_rng_seed goes in the header's seed field as rng_seed)"""
+    MAGIC = b"KRPL"
+    VERSION = 2
+    HEADER = struct.Struct("<4sHBBqBBBIBH")     # ... input count, flags, archive path length
+    FLAG_RESTART = 1
+    FLAG_NO_SEED = 2
+    
+    def __init__(self, world=1, level=1, seed=0, lives=3, powerup=0, coins=0, restart=False, archive=None,
+                 rng_seed=None):
+        self.world, self.level, self.seed = world, level, seed
+        self.lives, self.powerup, self.coins = lives, powerup, coins
+        self.restart = restart
+        self.archive = archive
+        self.rng_seed = seed if rng_seed is None else rng_seed
+        self.inputs = bytearray()
+        
+    def script(self):
+        """Hands out the inputs in order, one per simulated frame (the frame counter starts over
+        on a restart, the recording doesn't)"""
+        inputs = iter(self.inputs)
+        return lambda frame: next(inputs, 0)
+        
+    def save(self, path):
+        flags = (self.FLAG_RESTART if self.restart else 0) | (self.FLAG_NO_SEED if self.seed is None else 0)
+        archive = (self.archive or "").encode()
+        with open(path, "wb") as f:
+            f.write(self.HEADER.pack(self.MAGIC, self.VERSION, self.world, self.level, self.rng_seed or 0,
+                                     self.lives, self.powerup, self.coins, len(self.inputs), flags, len(archive)))
+            f.write(archive)
+            f.write(zlib.compress(bytes(self.inputs), 9))
+            
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            raw = f.read()
+        if len(raw) < cls.HEADER.size:
+            raise ValueError(f"{path}: not a v{cls.VERSION} replay")
+        magic, version, world, level, seed, lives, powerup, coins, n, flags, alen = cls.HEADER.unpack_from(raw)
+        if magic != cls.MAGIC or version != cls.VERSION:
+            raise ValueError(f"{path}: not a v{cls.VERSION} replay")
+        start = cls.HEADER.size + alen
+        rep = cls(world, level, None if flags & cls.FLAG_NO_SEED else seed, lives, powerup, coins,
+                  bool(flags & cls.FLAG_RESTART), raw[cls.HEADER.size:start].decode() or None, seed)
+        rep.inputs = bytearray(zlib.decompress(raw[start:]))
+        if len(rep.inputs) != n:
+            raise ValueError(f"{path}: truncated replay")
+        return rep
+
 # ╔═══════════════════════════════════════════════════════════════════════════════╗
 # ║ ENTITY BASE                                                                   ║
 # ╚═══════════════════════════════════════════════════════════════════════════════╝
 class Entity:
+    __slots__ = ("x", "y", "vx", "vy", "w", "h", "on_ground", "facing_right", "active", "px", "py", "_rect")
+    
     def __init__(self, x, y):
         self.x, self.y = float(x), float(y)
         self.vx, self.vy = 0.0, 0.0
@@ -132,9 +251,14 @@ class Entity:
         self.on_ground = False
         self.facing_right = True
         self.active = True
+        self.px, self.py = self.x, self.y
+        self._rect = pygame.Rect(0, 0, 0, 0)
         
     def rect(self):
-        return pygame.Rect(int(self.x), int(self.y), self.w, self.h)
+        """The entity's own Rect, synced in place to x/y/w/h; valid until the next call"""
+        r = self._rect
+        r.update(int(self.x), int(self.y), self.w, self.h)
+        return r
         
     def collides(self, other):
         return self.rect().colliderect(other.rect())
@@ -143,6 +267,9 @@ class Entity:
 # ║ PLAYER (SMB1 Accurate)                                                        ║
 # ╚═══════════════════════════════════════════════════════════════════════════════╝
 class Player(Entity):
+    __slots__ = ("dead", "death_timer", "invincible", "victory", "victory_timer", "flag_slide", "flag_y",
+                 "jump_held", "jump_timer", "coyote", "skidding", "anim", "anim_t")
+    
     def __init__(self, x, y):
         super().__init__(x, y)
         self.w = 12
@@ -264,17 +391,21 @@ class Player(Entity):
             self.die()
             
     def _move(self, tmap, dt):
+        # Each pass takes its candidates from the rect it started from through the moved one, as
+        # pushback can carry the body back across a tile boundary onto tiles the moved rect missed
+        start = self.rect().copy()
         self.x += self.vx * dt * 60
-        for r in tmap.colliders:
+        for r in tmap.solids_at(start.union(self.rect())):
             if self.rect().colliderect(r):
                 if self.vx > 0: self.x = r.left - self.w
                 elif self.vx < 0: self.x = r.right
                 self.vx = 0
-        if self.x < 0: self.x, self.vx = 0, 0
+        if self.x < tmap.left: self.x, self.vx = tmap.left, 0
         
+        start = self.rect().copy()
         self.y += self.vy * dt * 60
         self.on_ground = False
-        for r in tmap.colliders:
+        for r in tmap.solids_at(start.union(self.rect())):
             if self.rect().colliderect(r):
                 if self.vy > 0:
                     self.y = r.top - self.h
@@ -382,6 +513,8 @@ class Player(Entity):
 # ║ ENEMIES                                                                       ║
 # ╚═══════════════════════════════════════════════════════════════════════════════╝
 class Goomba(Entity):
+    __slots__ = ("anim", "anim_t", "squished", "squish_t")
+    
     def __init__(self, x, y):
         super().__init__(x, y)
         self.vx = -GOOMBA_SPEED
@@ -398,12 +531,12 @@ class Goomba(Entity):
             return
         self.vy = min(self.vy + GRAVITY * dt * 60, MAX_FALL)
         self.x += self.vx * dt * 60
-        for r in tmap.colliders:
+        for r in tmap.solids_at(self.rect()):
             if self.rect().colliderect(r):
                 self.vx = GOOMBA_SPEED if self.vx < 0 else -GOOMBA_SPEED
         self.y += self.vy * dt * 60
         self.on_ground = False
-        for r in tmap.colliders:
+        for r in tmap.solids_at(self.rect()):
             if self.rect().colliderect(r):
                 if self.vy > 0:
                     self.y = r.top - self.h
@@ -441,9 +574,12 @@ class Goomba(Entity):
             pygame.draw.rect(surf, PAL[0], (x+11, y+5, 2, 2))
 
 class Koopa(Entity):
+    __slots__ = ("anim", "anim_t", "shell", "shell_moving", "shell_timer", "_probe")
+    
     def __init__(self, x, y):
         super().__init__(x, y)
         self.vx = -KOOPA_SPEED
+        self._probe = pygame.Rect(0, 0, 4, 4)
         self.anim = 0
         self.anim_t = 0
         self.shell = False
@@ -461,19 +597,20 @@ class Koopa(Entity):
         self.vy = min(self.vy + GRAVITY * dt * 60, MAX_FALL)
         if self.shell_moving or not self.shell:
             self.x += self.vx * dt * 60
-        for r in tmap.colliders:
+        for r in tmap.solids_at(self.rect()):
             if self.rect().colliderect(r):
                 self.vx *= -1
                 self.facing_right = self.vx > 0
         if not self.shell and self.on_ground:
             edge_x = self.x + (self.w + 2 if self.vx > 0 else -2)
-            edge_r = pygame.Rect(edge_x, self.y + self.h + 2, 4, 4)
-            if not any(edge_r.colliderect(r) for r in tmap.colliders):
+            probe = self._probe
+            probe.update(edge_x, self.y + self.h + 2, 4, 4)
+            if not tmap.solids_at(probe):
                 self.vx *= -1
                 self.facing_right = self.vx > 0
         self.y += self.vy * dt * 60
         self.on_ground = False
-        for r in tmap.colliders:
+        for r in tmap.solids_at(self.rect()):
             if self.rect().colliderect(r):
                 if self.vy > 0:
                     self.y = r.top - self.h
@@ -524,10 +661,12 @@ class Koopa(Entity):
             pygame.draw.rect(surf, PAL[40], (x+9, y+20-fy, 5, 4))
 
 class PiranhaPlant(Entity):
-    def __init__(self, x, y):
+    __slots__ = ("base_y", "timer", "state", "offset")
+    
+    def __init__(self, x, y, rng=random):
         super().__init__(x, y)
         self.base_y = y
-        self.timer = random.random() * 3
+        self.timer = rng.random() * 3
         self.state = "hiding"
         self.offset = 0
         
@@ -568,13 +707,17 @@ class PiranhaPlant(Entity):
         if stem_h > 0:
             pygame.draw.rect(surf, PAL[26], (x+5, y+12, 6, stem_h))
 
-def create_enemy(etype, x, y):
-    return {"goomba": Goomba, "koopa": Koopa, "piranha": PiranhaPlant}.get(etype, Goomba)(x, y)
+def create_enemy(etype, x, y, rng=random):
+    if etype == "piranha":
+        return PiranhaPlant(x, y, rng)
+    return {"goomba": Goomba, "koopa": Koopa}.get(etype, Goomba)(x, y)
 
 # ╔═══════════════════════════════════════════════════════════════════════════════╗
 # ║ ITEMS                                                                         ║
 # ╚═══════════════════════════════════════════════════════════════════════════════╝
 class Mushroom(Entity):
+    __slots__ = ("emerge_t", "start_y", "emerged")
+    
     def __init__(self, x, y):
         super().__init__(x, y)
         self.vx = 1.0
@@ -591,11 +734,11 @@ class Mushroom(Entity):
         self.emerged = True
         self.vy = min(self.vy + GRAVITY * dt * 60, MAX_FALL)
         self.x += self.vx * dt * 60
-        for r in tmap.colliders:
+        for r in tmap.solids_at(self.rect()):
             if self.rect().colliderect(r):
                 self.vx *= -1
         self.y += self.vy * dt * 60
-        for r in tmap.colliders:
+        for r in tmap.solids_at(self.rect()):
             if self.rect().colliderect(r):
                 if self.vy > 0:
                     self.y = r.top - self.h
@@ -620,8 +763,11 @@ class Mushroom(Entity):
         pygame.draw.rect(surf, PAL[54], (x+4, y+10, 8, 6))
 
 class CoinEffect:
+    __slots__ = ("x", "y", "px", "py", "vy", "life", "active", "anim", "anim_t")
+    
     def __init__(self, x, y):
         self.x, self.y = x, y
+        self.px, self.py = x, y
         self.vy = -8
         self.life = 0.4
         self.active = True
@@ -647,197 +793,412 @@ class CoinEffect:
 # ╔═══════════════════════════════════════════════════════════════════════════════╗
 # ║ TILEMAP                                                                       ║
 # ╚═══════════════════════════════════════════════════════════════════════════════╝
+def level_rows(tiles):
+    """Tile rows as bytes, whether given as str (generator, editor) or bytes (.kpl files)"""
+    return [row if isinstance(row, (bytes, bytearray)) else row.encode() for row in tiles]
+
 class TileMap:
-    def __init__(self, data, effects, items):
+    def __init__(self, data, effects, items, bake_background=False, merge_colliders=False):
         self.effects = effects
         self.items = items
         self.tiles = []
         self.colliders = []
+        self.cells = {}
         self.qblocks = {}
         self.bricks = set()
         self.theme_id = data.get("theme", 1)
         self.theme = THEMES.get(self.theme_id, THEMES[1])
-        tiles = data["tiles"]
+        self.atlas = tile_atlas(self.theme_id)
+        self.bake_background = bake_background
+        self.merge_colliders = merge_colliders
+        self.merged_at = {}
+        self.chunk_tiles = {}
+        self.chunks = {}
+        self._shared = False
+        tiles = level_rows(data["tiles"])
+        self.left = 0
         self.width = data.get("width", len(tiles[0]) * TILE)
         self.height = len(tiles) * TILE
-        bc = data.get("block_contents", {})
+        self.bg_width = self.width
+        self._add_tiles(tiles, 0, data.get("block_contents", {}))
         
+    def _add_tiles(self, tiles, x0, bc):
+        """Add bytes rows starting at column x0, with ? block contents from bc (keyed "x,y")"""
+        added = []
         for y, row in enumerate(tiles):
-            for x, c in enumerate(row):
-                if c == " ": continue
+            for x, b in enumerate(row, x0):
+                if b == 32: continue
+                c = chr(b)
                 px, py = x * TILE, y * TILE
                 self.tiles.append((px, py, c))
+                self.chunk_tiles.setdefault(x // CHUNK_COLS, []).append((px, py, c))
                 if c in "GDBPT?":
-                    self.colliders.append(pygame.Rect(px, py, TILE, TILE))
+                    r = pygame.Rect(px, py, TILE, TILE)
+                    added.append(r)
+                    self.cells[(x, y)] = r
                 if c == "?":
                     self.qblocks[(px, py)] = {"hit": False, "contents": bc.get(f"{x},{y}", "coin")}
                 elif c == "B":
                     self.bricks.add((px, py))
+        if self.merge_colliders:
+            self._add_merged([(r.x // TILE, r.y // TILE) for r in added])
+        else:
+            self.colliders += added
+                    
+    def _add_merged(self, cells):
+        for r in merge_solids(cells):
+            self.colliders.append(r)
+            for tx in range(r.left // TILE, r.right // TILE):
+                for ty in range(r.top // TILE, r.bottom // TILE):
+                    self.merged_at[(tx, ty)] = r
+                    
+    def _split_merged(self, tx, ty):
+        """Remove one cell from its merged collider, re-merging what is left of it"""
+        r = self.merged_at.pop((tx, ty), None)
+        if r is None: return
+        self.colliders = [c for c in self.colliders if c is not r]
+        self._add_merged([(x, y) for x in range(r.left // TILE, r.right // TILE)
+                          for y in range(r.top // TILE, r.bottom // TILE) if (x, y) != (tx, ty)])
+                    
+    def clone(self, effects=None, items=None):
+        """A copy sharing this map's state until its first block hit (copy-on-write)"""
+        twin = copy.copy(self)
+        twin.effects = [] if effects is None else effects
+        twin.items = [] if items is None else items
+        twin._shared = True
+        return twin
+        
+    def _own(self):
+        """Take private copies of everything hit_block mutates in place"""
+        if not self._shared: return
+        self._shared = False
+        self.qblocks = {pos: dict(b) for pos, b in self.qblocks.items()}
+        self.bricks = set(self.bricks)
+        self.cells = dict(self.cells)
+        self.merged_at = dict(self.merged_at)
+        self.chunk_tiles = dict(self.chunk_tiles)
+        self.chunks = dict(self.chunks)
                     
     def hit_block(self, bx, by, player):
         pos = (bx, by)
-        if pos in self.qblocks:
+        if pos in self.qblocks and not self.qblocks[pos]["hit"]:
+            self._own()
             b = self.qblocks[pos]
-            if not b["hit"]:
-                b["hit"] = True
-                if b["contents"] == "coin":
-                    state.add_coin()
-                    self.effects.append(CoinEffect(bx + 4, by - TILE))
-                elif b["contents"] == "mushroom":
-                    self.items.append(Mushroom(bx, by - TILE))
+            b["hit"] = True
+            self.chunks.pop(bx // CHUNK_W, None)
+            if b["contents"] == "coin":
+                state.add_coin()
+                self.effects.append(CoinEffect(bx + 4, by - TILE))
+            elif b["contents"] == "mushroom":
+                self.items.append(Mushroom(bx, by - TILE))
         if pos in self.bricks and state.powerup > 0:
+            self._own()
             self.bricks.discard(pos)
             self.tiles = [(tx, ty, c) for tx, ty, c in self.tiles if not (tx == bx and ty == by)]
-            self.colliders = [r for r in self.colliders if not (r.x == bx and r.y == by)]
+            ci = bx // CHUNK_W
+            self.chunk_tiles[ci] = [(tx, ty, c) for tx, ty, c in self.chunk_tiles[ci] if not (tx == bx and ty == by)]
+            self.chunks.pop(ci, None)
+            if self.merge_colliders:
+                self._split_merged(bx // TILE, by // TILE)
+            else:
+                self.colliders = [r for r in self.colliders if not (r.x == bx and r.y == by)]
+            self.cells.pop((bx // TILE, by // TILE), None)
             state.score += 50
             
-    def draw(self, surf, cam):
-        surf.fill(PAL[self.theme["sky"]])
-        # Hills
-        for i in range(10):
-            hx = (i * 200 - int(cam * 0.3)) % (self.width + 300) - 100
-            pygame.draw.polygon(surf, PAL[26], [(hx, HEIGHT - 60), (hx + 50, HEIGHT - 120), (hx + 100, HEIGHT - 60)])
-        # Bushes
-        for i in range(15):
-            bx = (i * 120 - int(cam * 0.5)) % (self.width + 200) - 50
-            pygame.draw.ellipse(surf, PAL[26], (bx, HEIGHT - 70, 60, 30))
-        # Clouds
-        for i in range(8):
-            cx = (i * 180 - int(cam * 0.2)) % (self.width + 300) - 100
-            cy = 40 + (i % 3) * 30
-            pygame.draw.ellipse(surf, PAL[32], (cx, cy, 48, 24))
-            pygame.draw.ellipse(surf, PAL[32], (cx + 24, cy - 10, 40, 28))
-        # Tiles
-        for tx, ty, c in self.tiles:
-            dx = tx - cam
-            if dx < -TILE or dx > WIDTH + TILE: continue
-            self._draw_tile(surf, dx, ty, c, tx, ty)
+    def solids_at(self, rect):
+        """Solid tile rects in the grid cells overlapping rect, in row-major order"""
+        cells = self.cells
+        x0, x1 = rect.left // TILE, (rect.right - 1) // TILE
+        found = []
+        for ty in range(rect.top // TILE, (rect.bottom - 1) // TILE + 1):
+            for tx in range(x0, x1 + 1):
+                r = cells.get((tx, ty))
+                if r is not None:
+                    found.append(r)
+        return found
             
-    def _draw_tile(self, surf, dx, dy, c, tx, ty):
-        t = self.theme
-        if c == "G":
-            pygame.draw.rect(surf, PAL[t["ground"]], (dx, dy, TILE, TILE))
-            pygame.draw.rect(surf, PAL[26], (dx, dy, TILE, 4))
-        elif c == "D":
-            pygame.draw.rect(surf, PAL[max(0, t["ground"]-1)], (dx, dy, TILE, TILE))
-        elif c == "B":
-            if (tx, ty) in self.bricks:
-                pygame.draw.rect(surf, PAL[t["brick"]], (dx, dy, TILE, TILE))
-                pygame.draw.rect(surf, PAL[0], (dx, dy+7, TILE, 2))
-                pygame.draw.rect(surf, PAL[0], (dx+7, dy, 2, TILE))
-        elif c == "?":
-            if (tx, ty) in self.qblocks and self.qblocks[(tx, ty)]["hit"]:
-                pygame.draw.rect(surf, PAL[23], (dx, dy, TILE, TILE))
+    def draw(self, surf, cam):
+        # Sky, hills, bushes and clouds from cached strips
+        if self.bake_background:
+            strip, period = baked_background(self.theme_id, self.bg_width)
+            bx = -int(cam * BG_LAYERS[0][1]) % period
+            surf.blits(((strip, (bx, 0)), (strip, (bx - period, 0))), doreturn=False)
+        else:
+            surf.fill(PAL[self.theme["sky"]])
+            batch = []
+            for strip, factor, period, offset, top in background_layers(self.bg_width):
+                bx = -int(cam * factor) % period + offset
+                batch.append((strip, (bx, top)))
+                batch.append((strip, (bx - period, top)))
+            surf.blits(batch, doreturn=False)
+        # Tiles, as prerendered chunks overlapping the camera
+        batch = []
+        for ci in range(max(0, int(cam) // CHUNK_W), int(cam + WIDTH) // CHUNK_W + 1):
+            chunk = self.chunks.get(ci)
+            if chunk is None:
+                if ci not in self.chunk_tiles: continue
+                chunk = self._render_chunk(ci)
+            batch.append((chunk, (ci * CHUNK_W - cam, 0)))
+        surf.blits(batch, doreturn=False)
+        
+    def _render_chunk(self, ci):
+        """Prerender one column chunk; hit_block drops it from self.chunks to invalidate"""
+        atlas = self.atlas
+        x0 = ci * CHUNK_W
+        batch = []
+        for tx, ty, c in self.chunk_tiles[ci]:
+            if c == "?" and self.qblocks[(tx, ty)]["hit"]:
+                c = "?hit"
+            sprite = atlas.get(c)
+            if sprite is not None:
+                batch.append((sprite, (tx - x0, ty)))
+        chunk = pygame.Surface((CHUNK_W, self.height))
+        chunk.fill(CHUNK_KEY)
+        chunk.blits(batch, doreturn=False)
+        if pygame.display.get_surface() is not None:
+            chunk = chunk.convert()
+        chunk.set_colorkey(CHUNK_KEY, RLEACCEL)
+        self.chunks[ci] = chunk
+        return chunk
+
+def merge_solids(cells):
+    """Greedy cover of (tx, ty) cells: horizontal runs first, then identical runs stacked vertically"""
+    rows = {}
+    for tx, ty in cells:
+        rows.setdefault(ty, []).append(tx)
+    rects = []
+    above = {}
+    for ty in sorted(rows):
+        xs = sorted(rows[ty])
+        runs = []
+        start = prev = xs[0]
+        for tx in xs[1:]:
+            if tx != prev + 1:
+                runs.append((start, prev))
+                start = tx
+            prev = tx
+        runs.append((start, prev))
+        current = {}
+        for run in runs:
+            r = above.get(run)
+            if r is not None and r.bottom == ty * TILE:
+                r.height += TILE
             else:
-                pygame.draw.rect(surf, PAL[39], (dx, dy, TILE, TILE))
-                pygame.draw.rect(surf, PAL[40], (dx+2, dy+2, 12, 12))
-                pygame.draw.rect(surf, PAL[23], (dx+5, dy+3, 6, 2))
-                pygame.draw.rect(surf, PAL[23], (dx+9, dy+5, 2, 3))
-                pygame.draw.rect(surf, PAL[23], (dx+5, dy+8, 6, 2))
-                pygame.draw.rect(surf, PAL[23], (dx+7, dy+12, 2, 2))
-        elif c == "P":
-            pygame.draw.rect(surf, PAL[t["ground"]], (dx, dy, TILE, TILE))
-            pygame.draw.rect(surf, PAL[0], (dx+2, dy+2, 12, 12))
-        elif c == "T":
-            pygame.draw.rect(surf, PAL[t["pipe"]], (dx, dy, TILE, TILE))
-            pygame.draw.rect(surf, PAL[26], (dx+2, dy, 4, TILE))
+                r = pygame.Rect(run[0] * TILE, ty * TILE, (run[1] - run[0] + 1) * TILE, TILE)
+                rects.append(r)
+            current[run] = r
+        above = current
+    return rects
+
+# ╔═══════════════════════════════════════════════════════════════════════════════╗
+# ║ TILE ATLAS                                                                    ║
+# ╚═══════════════════════════════════════════════════════════════════════════════╝
+TILE_KINDS = ("G", "D", "B", "P", "T", "?", "?hit")
+_atlas_cache = {}
+
+def tile_atlas(theme_id):
+    """Tile sprites for a theme, rendered once and cached in display format"""
+    atlas = _atlas_cache.get(theme_id)
+    if atlas is None:
+        t = THEMES.get(theme_id, THEMES[1])
+        atlas = {}
+        for kind in TILE_KINDS:
+            sprite = pygame.Surface((TILE, TILE))
+            paint_tile(sprite, 0, 0, kind, t)
+            if pygame.display.get_surface() is not None:
+                sprite = sprite.convert()
+            atlas[kind] = sprite
+        _atlas_cache[theme_id] = atlas
+    return atlas
+
+def paint_tile(surf, dx, dy, c, t):
+    if c == "G":
+        pygame.draw.rect(surf, PAL[t["ground"]], (dx, dy, TILE, TILE))
+        pygame.draw.rect(surf, PAL[26], (dx, dy, TILE, 4))
+    elif c == "D":
+        pygame.draw.rect(surf, PAL[max(0, t["ground"]-1)], (dx, dy, TILE, TILE))
+    elif c == "B":
+        pygame.draw.rect(surf, PAL[t["brick"]], (dx, dy, TILE, TILE))
+        pygame.draw.rect(surf, PAL[0], (dx, dy+7, TILE, 2))
+        pygame.draw.rect(surf, PAL[0], (dx+7, dy, 2, TILE))
+    elif c == "?hit":
+        pygame.draw.rect(surf, PAL[23], (dx, dy, TILE, TILE))
+    elif c == "?":
+        pygame.draw.rect(surf, PAL[39], (dx, dy, TILE, TILE))
+        pygame.draw.rect(surf, PAL[40], (dx+2, dy+2, 12, 12))
+        pygame.draw.rect(surf, PAL[23], (dx+5, dy+3, 6, 2))
+        pygame.draw.rect(surf, PAL[23], (dx+9, dy+5, 2, 3))
+        pygame.draw.rect(surf, PAL[23], (dx+5, dy+8, 6, 2))
+        pygame.draw.rect(surf, PAL[23], (dx+7, dy+12, 2, 2))
+    elif c == "P":
+        pygame.draw.rect(surf, PAL[t["ground"]], (dx, dy, TILE, TILE))
+        pygame.draw.rect(surf, PAL[0], (dx+2, dy+2, 12, 12))
+    elif c == "T":
+        pygame.draw.rect(surf, PAL[t["pipe"]], (dx, dy, TILE, TILE))
+        pygame.draw.rect(surf, PAL[26], (dx+2, dy, 4, TILE))
+
+# ╔═══════════════════════════════════════════════════════════════════════════════╗
+# ║ PARALLAX BACKGROUND                                                           ║
+# ╚═══════════════════════════════════════════════════════════════════════════════╝
+_layer_cache = {}
+_baked_cache = {}
+
+def background_layers(width):
+    """Horizontally tileable strip per parallax layer, one period wide"""
+    layers = _layer_cache.get(width)
+    if layers is None:
+        layers = []
+        for name, factor, count, spacing, pad, offset, top, height in BG_LAYERS:
+            period = width + pad
+            strip = pygame.Surface((period, height))
+            strip.fill(CHUNK_KEY)
+            for i in range(count):
+                x = i * spacing % period
+                paint_layer_item(strip, name, i, x, top)
+                paint_layer_item(strip, name, i, x - period, top)
+            if pygame.display.get_surface() is not None:
+                strip = strip.convert()
+            strip.set_colorkey(CHUNK_KEY, RLEACCEL)
+            layers.append((strip, factor, period, offset, top))
+        _layer_cache[width] = layers
+    return layers
+
+def baked_background(theme_id, width):
+    """Sky and all layers flattened into one opaque strip scrolling at the hill rate"""
+    key = (theme_id, width)
+    baked = _baked_cache.get(key)
+    if baked is None:
+        period = width + BG_LAYERS[0][4]
+        strip = pygame.Surface((period, HEIGHT))
+        strip.fill(PAL[THEMES.get(theme_id, THEMES[1])["sky"]])
+        for name, factor, count, spacing, pad, offset, top, height in BG_LAYERS:
+            for i in range(count):
+                x = (i * spacing + offset) % period
+                for wrap in (x - period, x, x + period):
+                    paint_layer_item(strip, name, i, wrap, 0)
+        if pygame.display.get_surface() is not None:
+            strip = strip.convert()
+        baked = _baked_cache[key] = (strip, period)
+    return baked
+
+def paint_layer_item(surf, name, i, x, top):
+    if name == "hills":
+        pygame.draw.polygon(surf, PAL[26], [(x, HEIGHT - 60 - top), (x + 50, HEIGHT - 120 - top), (x + 100, HEIGHT - 60 - top)])
+    elif name == "bushes":
+        pygame.draw.ellipse(surf, PAL[26], (x, HEIGHT - 70 - top, 60, 30))
+    elif name == "clouds":
+        cy = 40 + (i % 3) * 30 - top
+        pygame.draw.ellipse(surf, PAL[32], (x, cy, 48, 24))
+        pygame.draw.ellipse(surf, PAL[32], (x + 24, cy - 10, 40, 28))
 
 # ╔═══════════════════════════════════════════════════════════════════════════════╗
 # ║ LEVEL GENERATOR                                                               ║
 # ╚═══════════════════════════════════════════════════════════════════════════════╝
+GROUND_TO_DIRT = bytes.maketrans(b"G", b"D")
+
+def level_seed(world, level, seed=None):
+    """The seed generate_level uses: the given one, else one derived from world and level"""
+    return world * 100 + level if seed is None else seed
+
+def level_rng_seed(data):
+    """The seed a level's enemies draw from: the one it was generated from, else (hand-made) a crc32
+    of its tiles, so a seedless level spawns the same way on every load"""
+    seed = data.get("seed")
+    return zlib.crc32(b"".join(level_rows(data["tiles"]))) if seed is None else seed
+
+# Building blocks shared by generate_level and the endless stream; each draws from rng in a fixed
+# order and writes into bytearray rows, with lo/hi bounding where a piece may start
+def _lay_ground(tiles, rng, gy, p_hole, lo, hi):
+    """Ground and dirt rows with one-tile holes strictly between lo and hi, some filled back in
+    (the drawn gap width is unused but keeps the RNG stream)"""
+    rand, randint = rng.random, rng.randint
+    w = len(tiles[gy])
+    holes = []
+    for x in range(w):
+        if rand() < p_hole and lo < x < hi:
+            randint(2, 3)
+            holes.append(x)
+    G, GAP = ord("G"), ord(" ")
+    ground = tiles[gy] = bytearray(b"G" * w)
+    for x in holes:
+        ground[x] = GAP
+    for x in holes:
+        if ground[x - 1] == G or ground[x + 1] == G:
+            if rand() > 0.4:
+                ground[x] = G
+    tiles[gy + 1] = ground.translate(GROUND_TO_DIRT)
+
+def _lay_platforms(tiles, rng, n, lo, hi, gy):
+    randint = rng.randint
+    for _ in range(n):
+        px = randint(lo, hi)
+        py = randint(gy - 7, gy - 3)
+        pw = randint(3, 6)
+        tiles[py][px:px + pw] = b"P" * pw
+
+def _lay_qblocks(tiles, rng, n, lo, hi, gy):
+    randint = rng.randint
+    qblocks = []
+    for _ in range(n):
+        qx = randint(lo, hi)
+        qy = randint(gy - 6, gy - 3)
+        tiles[qy][qx:qx + 1] = b"?"
+        qblocks.append((qx, qy))
+    return qblocks
+
+def _lay_bricks(tiles, rng, n, lo, hi, gy):
+    randint = rng.randint
+    for _ in range(n):
+        bx = randint(lo, hi)
+        by = randint(gy - 5, gy - 3)
+        bl = randint(1, 4)
+        tiles[by][bx:bx + bl] = b"B" * bl
+
+def _lay_pipes(tiles, rng, n, lo, hi, gy, tallest=4):
+    randint = rng.randint
+    for _ in range(n):
+        px = randint(lo, hi)
+        ph = randint(2, tallest)
+        for py in range(gy - ph, gy):
+            tiles[py][px:px + 2] = b"TT"
+
+def _lay_enemies(rng, n, lo, hi, gy):
+    enemy_types = ["goomba", "goomba", "koopa"]
+    return [{"x": rng.randint(lo, hi) * TILE, "y": (gy - 1) * TILE, "type": rng.choice(enemy_types)}
+            for _ in range(n)]
+
+def _block_contents(rng, qblocks):
+    return {(qx, qy): "mushroom" if rng.random() < 0.25 else "coin" for qx, qy in qblocks}
+
 def generate_level(world=1, level=1, seed=None):
-    if seed is None:
-        seed = world * 100 + level
-    random.seed(seed)
+    seed = level_seed(world, level, seed)
+    rng = random.Random(seed)
     
     w = 150 + world * 20
     h = 15
-    tiles = [[" "] * w for _ in range(h)]
+    tiles = [bytearray(b" " * w) for _ in range(h)]
     gy = h - 2
     
-    # Ground
-    for x in range(w):
-        if random.random() < 0.02 * world and 20 < x < w - 30:
-            gap = random.randint(2, 3)
-            for gx in range(gap):
-                if x + gx < w: pass
-            continue
-        tiles[gy][x] = "G"
-        tiles[gy + 1][x] = "D"
-        
-    # Fill gaps
-    for x in range(w):
-        if tiles[gy][x] == " " and x > 0 and x < w - 1:
-            if tiles[gy][x-1] == "G" or tiles[gy][x+1] == "G":
-                if random.random() > 0.4:
-                    tiles[gy][x] = "G"
-                    tiles[gy + 1][x] = "D"
-                    
-    # Platforms
-    for _ in range(w // 15):
-        px = random.randint(10, w - 20)
-        py = random.randint(gy - 7, gy - 3)
-        pw = random.randint(3, 6)
-        for i in range(pw):
-            if 0 <= px + i < w and 0 <= py < h:
-                tiles[py][px + i] = "P"
-                
-    # ? Blocks
-    qblocks = []
-    for _ in range(w // 12):
-        qx = random.randint(10, w - 15)
-        qy = random.randint(gy - 6, gy - 3)
-        if 0 <= qx < w and 0 <= qy < h:
-            tiles[qy][qx] = "?"
-            qblocks.append((qx, qy))
-            
-    # Bricks
-    for _ in range(w // 8):
-        bx = random.randint(10, w - 15)
-        by = random.randint(gy - 5, gy - 3)
-        bl = random.randint(1, 4)
-        for i in range(bl):
-            if 0 <= bx + i < w and 0 <= by < h:
-                tiles[by][bx + i] = "B"
-                
-    # Pipes
-    for _ in range(w // 25):
-        px = random.randint(15, w - 20)
-        ph = random.randint(2, 4)
-        for py in range(gy - ph, gy):
-            if 0 <= py < h:
-                tiles[py][px] = "T"
-                tiles[py][px + 1] = "T"
+    _lay_ground(tiles, rng, gy, 0.02 * world, 20, w - 30)
+    _lay_platforms(tiles, rng, w // 15, 10, w - 20, gy)
+    qblocks = _lay_qblocks(tiles, rng, w // 12, 10, w - 15, gy)
+    _lay_bricks(tiles, rng, w // 8, 10, w - 15, gy)
+    _lay_pipes(tiles, rng, w // 25, 15, w - 20, gy)
                 
     # Stairs at end
     for i in range(8):
-        for j in range(i + 1):
-            sx = w - 25 + i
-            sy = gy - j - 1
-            if 0 <= sx < w and 0 <= sy < h:
-                tiles[sy][sx] = "B"
+        sx = w - 25 + i
+        for sy in range(gy - i - 1, gy):
+            tiles[sy][sx:sx + 1] = b"B"
                 
     # Flagpole
-    for i in range(8):
-        fx = w - 12
-        fy = gy - i - 1
-        if 0 <= fy < h:
-            tiles[fy][fx] = "P"
+    fx = w - 12
+    for fy in range(gy - 8, gy):
+        tiles[fy][fx:fx + 1] = b"P"
             
-    tile_strs = ["".join(row) for row in tiles]
-    
-    # Enemies
-    enemies = []
-    enemy_types = ["goomba", "goomba", "koopa"]
-    for _ in range(8 + world * 2):
-        ex = random.randint(20, w - 30) * TILE
-        ey = (gy - 1) * TILE
-        enemies.append({"x": ex, "y": ey, "type": random.choice(enemy_types)})
-        
-    # Block contents
-    bc = {}
-    for qx, qy in qblocks:
-        bc[f"{qx},{qy}"] = "mushroom" if random.random() < 0.25 else "coin"
+    tile_strs = [row.decode() for row in tiles]
+    enemies = _lay_enemies(rng, 8 + world * 2, 20, w - 30, gy)
+    bc = {f"{x},{y}": c for (x, y), c in _block_contents(rng, qblocks).items()}
         
     return {
         "tiles": tile_strs,
@@ -846,58 +1207,829 @@ def generate_level(world=1, level=1, seed=None):
         "flag_pos": ((w - 12) * TILE, (gy - 9) * TILE),
         "width": w * TILE,
         "block_contents": bc,
-        "theme": world
+        "theme": world,
+        "seed": seed
+    }
+
+LEVEL_CACHE_SIZE = 8
+
+class LevelPreloader:
+    """Builds levels on a worker thread ahead of need and keeps an LRU of pristine TileMaps"""
+    
+    def __init__(self, size=LEVEL_CACHE_SIZE, archive=None):
+        self.archive = archive
+        self.pool = None
+        self.key = None
+        self.future = None
+        self.cache = OrderedDict()
+        self.size = size
+        
+    def _key(self, world, level, seed, bake_background, merge_colliders):
+        # Archived slots are keyed with seed None; asking for the seed they were made from hits them too
+        name = f"{world}-{level}"
+        if self.archive is not None and name in self.archive and seed in (None, self.archive.seed(name)):
+            seed = None
+        else:
+            seed = level_seed(world, level, seed)
+        return world, level, seed, bake_background, merge_colliders
+        
+    def prepare(self, world, level, seed=None, bake_background=False, merge_colliders=False):
+        key = self._key(world, level, seed, bake_background, merge_colliders)
+        if key == self.key or key in self.cache: return
+        if self.future is not None:
+            self.future.cancel()
+        self.key = key
+        self.future = self.submit(self._build, *key)
+        
+    def submit(self, fn, *args):
+        """Run other background work (endless segments, editor checks) on the same worker thread"""
+        if self.pool is None:
+            self.pool = ThreadPoolExecutor(1, thread_name_prefix="koopa-preload")
+        return self.pool.submit(fn, *args)
+        
+    def _build(self, world, level, seed, bake_background, merge_colliders):
+        data = self.archive.get(f"{world}-{level}") if seed is None else generate_level(world, level, seed)
+        return data, TileMap(data, [], [], bake_background, merge_colliders)
+        
+    def get(self, world, level, seed=None, bake_background=False, merge_colliders=False):
+        """(data, tmap) for a level: a clone of the cached map, else prepared or built right here"""
+        key = self._key(world, level, seed, bake_background, merge_colliders)
+        entry = self.cache.get(key)
+        if entry is None:
+            if key == self.key:
+                future = self.future
+                self.key = self.future = None
+                if not future.cancel():
+                    entry = future.result()
+            if entry is None:
+                entry = self._build(*key)
+            self.cache[key] = entry
+            if len(self.cache) > self.size:
+                self.cache.popitem(last=False)
+        else:
+            self.cache.move_to_end(key)
+        data, pristine = entry
+        return data, pristine.clone()
+
+# ╔═══════════════════════════════════════════════════════════════════════════════╗
+# ║ LEVEL ANALYSIS                                                                ║
+# ╚═══════════════════════════════════════════════════════════════════════════════╝
+SOLID_TILES = "GDBPT?"
+SOLID_CODES = frozenset(SOLID_TILES.encode())
+ARC_SPEEDS = tuple(RUN_SPEED * i / 8 for i in range(1, 9))
+ARC_HOLDS = tuple(JUMP_HOLD_TIME * i / 4 for i in range(5))
+ARC_REACH = 7       # columns either side that any modelled jump can land in
+ARC_PAD = 8         # row bits above the level and wall columns beyond it in the analyzer grid
+# Compiled arc step kinds: any hit ends the arc / lands on the hit cell / a wall hit turns the arc
+# into a slide up that wall / no hit lets a slide through onto its release arc
+ARC_BLOCK, ARC_LAND, ARC_WALL, ARC_PASS = range(4)
+
+def _arc_frame(st, speed, accel, hold):
+    """One frame of a jump held for hold seconds, as Player.update: st is (x, y, vx, vy, hold timer,
+    frames) and comes back with vx sped up by accel towards speed, x moved and vy updated (y still
+    to move, as _move resolves x first)"""
+    x, y, vx, vy, timer, n = st
+    if n and n * SIM_DT >= hold:
+        timer = 0
+    elif n and timer > 0 and vy < 0:
+        timer -= SIM_DT
+    vx = min(speed, vx + accel)
+    grav = GRAVITY_HOLD if (vy < 0 and timer > 0) else GRAVITY
+    vy = min(vy + grav, MAX_FALL)
+    return x + vx, y, vx, vy, timer, n + 1
+
+def _arc_start(speed, vy=None, standstill=False):
+    if vy is None:
+        vy = JUMP_RUN if speed > WALK_SPEED * 0.8 and not standstill else JUMP_WALK
+    return 0.0, 0.0, 0.0 if standstill else speed, vy, JUMP_HOLD_TIME if vy < 0 else 0, 0
+
+def _body_rows(y):
+    iy = math.floor(y)
+    return tuple(range(iy // TILE, (iy + 15) // TILE + 1))
+
+def _pack(cells):
+    cols = {}
+    for dx, dy in cells:
+        cols[dx] = cols.get(dx, 0) | 1 << (dy + ARC_PAD)
+    return tuple(sorted(cols.items()))
+
+def _arc_steps(st, x0, speed, accel, hold, depth, swept=frozenset(), slide=True, moved=False):
+    """Compile a jump from state st to the tile cells the small player's 12x16 body newly enters,
+    starting at pixel x0 of its tile, resolved like Player._move: each frame moves x at the old
+    height, then y. Cells entered rising block the arc (merged into one step up to the next other
+    step); the row a falling y move enters is a landing step, on whichever of its cells is solid.
+    The column an x move enters is a wall step, branching into _slide_steps (or, once slid, blocks).
+    moved: st already has this frame's x move done and checked. Steps are (cells, landing row offset,
+    kind, branch), cells packed per column as ((dx, row bits), ...) with bit dy + ARC_PAD for row dy
+    and branch a cached call returning the wall or pass step's steps"""
+    steps = []
+    swept = set(swept)
+    blocking = []
+    
+    def enter(x, y):
+        ix = math.floor(x0 + x)
+        new = [(cx, cy) for cy in _body_rows(y) for cx in range(ix // TILE, (ix + 11) // TILE + 1)
+               if (cx, cy) not in swept]
+        swept.update(new)
+        return new
+        
+    def flush():
+        if blocking:
+            steps.append((_pack(blocking), 0, ARC_BLOCK, None))
+            blocking.clear()
+            
+    while True:
+        if moved:
+            x, y, vx, vy, timer, n = st
+            moved = False
+        else:
+            before = frozenset(swept)
+            x, y, vx, vy, timer, n = st = _arc_frame(st, speed, accel, hold)
+            new = enter(x, y)
+            if new and slide:
+                flush()
+                cap = WALK_SPEED if speed <= WALK_SPEED else RUN_SPEED
+                steps.append((_pack(new), 0, ARC_WALL, functools.cache(functools.partial(
+                    _slide_steps, st, x0, new[-1][0], cap, hold, depth, before))))
+            else:
+                blocking += new
+        y += vy
+        new = enter(x, y)
+        if vy <= 0:
+            blocking += new
+        elif new:
+            flush()
+            steps.append((_pack(new), new[0][1] - 1, ARC_LAND, None))
+        st = (x, y, vx, vy, timer, n)
+        if y >= depth and vy > 0:
+            return tuple(steps)
+
+def _slide_steps(st, x0, col, speed, hold, depth, swept):
+    """A jump pushed back off the wall in column col (so vx is 0) and still pressing into it: each
+    time the body reaches the wall at rows not yet found blocked, a pass step tries them and goes on
+    as an ordinary arc (with no second slide) if they are clear. Lands or blocks like _arc_steps"""
+    steps = []
+    swept = set(swept)
+    blocking = []
+    tried = {_body_rows(st[1])}
+    flush_x = col * TILE - 12 - x0
+    x, y, vx, vy, timer, n = st
+    x, vx = flush_x, 0.0
+    while True:
+        y += vy
+        ix = math.floor(x0 + x)
+        new = [(ix // TILE, cy) for cy in _body_rows(y) if (ix // TILE, cy) not in swept]
+        swept.update(new)
+        if vy <= 0:
+            blocking += new
+        elif new:
+            if blocking:
+                steps.append((_pack(blocking), 0, ARC_BLOCK, None))
+                blocking = []
+            steps.append((_pack(new), new[0][1] - 1, ARC_LAND, None))
+        if y >= depth and vy > 0:
+            return tuple(steps)
+        x, y, vx, vy, timer, n = _arc_frame((x, y, vx, vy, timer, n), speed, AIR_ACCEL, hold)
+        if math.floor(x0 + x) + 11 >= col * TILE:
+            rows = _body_rows(y)
+            if rows not in tried:
+                tried.add(rows)
+                if blocking:
+                    steps.append((_pack(blocking), 0, ARC_BLOCK, None))
+                    blocking = []
+                cells = [(col, cy) for cy in rows]
+                release = functools.cache(functools.partial(
+                    _arc_steps, (x, y, vx, vy, timer, n), x0, speed, AIR_ACCEL, hold, depth,
+                    swept | set(cells), slide=False, moved=True))
+                steps.append((_pack(cells), 0, ARC_PASS, release))
+            x, vx = flush_x, 0.0
+
+_jump_table = None
+
+def jump_table():
+    """(jumps, falls): every modelled jump and walk-off fall facing right, compiled to cell steps once;
+    standstill jumps take off flush with the next column. Slides compile the first time a wall is hit"""
+    global _jump_table
+    if _jump_table is None:
+        depth = 16 * TILE
+        jumps = [_arc_steps(_arc_start(s), 2, s, 0.0, h, depth) for s in ARC_SPEEDS for h in ARC_HOLDS]
+        jumps += [_arc_steps(_arc_start(s, standstill=True), TILE - 12, s, AIR_ACCEL, h, depth)
+                  for s in (WALK_SPEED, RUN_SPEED) for h in ARC_HOLDS]
+        falls = [_arc_steps(_arc_start(s, vy=0.0), TILE, s, 0.0, 0, depth) for s in (0.0,) + ARC_SPEEDS]
+        _jump_table = (jumps, falls)
+    return _jump_table
+
+def _follow(steps, base, r, d, cols, h):
+    """Landing cell of one compiled arc from standing cell (base - ARC_PAD, r) facing d,
+    or None if it is blocked or falls out of the level"""
+    for packed, top, kind, branch in steps:
+        if kind == ARC_LAND:
+            land = None
+            for dx, bits in packed:
+                if cols[base + d * dx] & bits << r:
+                    land = base + d * dx - ARC_PAD
+            if land is not None:
+                return land, r + top
+            if r + top >= h:
+                return None
+            continue
+        for dx, bits in packed:
+            if cols[base + d * dx] & bits << r:
+                if kind == ARC_BLOCK:
+                    return None
+                if kind == ARC_WALL:
+                    return _follow(branch(), base, r, d, cols, h)
+                break
+        else:
+            if kind == ARC_PASS:
+                return _follow(branch(), base, r, d, cols, h)
+    return None
+
+def analyze_level(data):
+    """Check a level can be finished: best-first search (rightmost first) over cells the small player
+    can stand in, linked by walking, walk-off falls and the jump table; reports whether the flag is
+    reached, how far it got and the standing cells on the way there"""
+    t0 = time.perf_counter()
+    tiles = level_rows(data["tiles"])
+    h, w = len(tiles), len(tiles[0])
+    # Solid rows per column as bits (row y -> bit y + ARC_PAD), with walls beyond both ends
+    wall = (1 << (h + 2 * ARC_PAD)) - 1
+    cols = [wall] * (w + 2 * ARC_PAD)
+    for x in range(w):
+        cols[x + ARC_PAD] = sum(1 << (y + ARC_PAD) for y, row in enumerate(tiles) if row[x] in SOLID_CODES)
+    solid = lambda x, y: cols[x + ARC_PAD] >> (y + ARC_PAD) & 1
+    jumps, falls = jump_table()
+    goal = -(-(data["flag_pos"][0] - 24) // TILE)
+    
+    c, r = int(data["player_start"][0]) // TILE, int(data["player_start"][1]) // TILE
+    while r < h and not solid(c, r + 1):
+        r += 1
+    came = {}
+    queue = []
+    if r < h and not solid(c, r):
+        came[(c, r)] = None
+        queue.append((-c, r))
+    end = (c, r)
+    solvable = False
+    while queue:
+        c, r = heapq.heappop(queue)
+        c = -c
+        if c > end[0]:
+            end = (c, r)
+        if c >= goal:
+            solvable = True
+            break
+        base = c + ARC_PAD
+        # Nothing but floor at r + 1 and open air up to jump height within reach: jumps only land on that floor
+        shift, plain = r + ARC_PAD - 5, 1 << 6
+        open_ground = all(cols[x] >> shift & 127 == plain for x in range(base - ARC_REACH, base + ARC_REACH + 1))
+        found = []
+        for d in (1, -1):
+            if not solid(c + d, r):
+                if solid(c + d, r + 1):
+                    found.append((c + d, r))
+                else:
+                    found.extend(_follow(steps, base, r, d, cols, h) for steps in falls)
+            if not open_ground:
+                found.extend(_follow(steps, base, r, d, cols, h) for steps in jumps)
+        for cell in found:
+            if cell is not None and cell not in came:
+                came[cell] = (c, r)
+                heapq.heappush(queue, (-cell[0], cell[1]))
+    path = [end] if end in came else []
+    while path and came[path[-1]] is not None:
+        path.append(came[path[-1]])
+    return {"solvable": solvable, "furthest": end[0], "goal": goal, "cells": len(came), "path": path[::-1],
+            "ms": (time.perf_counter() - t0) * 1000}
+
+def level_metrics(data, solve=True):
+    """Quality metrics for level data: ground gaps, enemy density, ? blocks and (unless solve is
+    False) whether analyze_level can finish it"""
+    tiles = level_rows(data["tiles"])
+    ground = tiles[len(tiles) - 2]
+    gaps = [len(g) for g in ground.split(b"G") if g]
+    width = data.get("width", len(ground) * TILE)
+    widest = max(gaps, default=0)
+    return {
+        "gaps": len(gaps),
+        "widest_gap": widest,
+        "enemies_per_screen": round(len(data.get("enemies", [])) * WIDTH / width, 3),
+        "qblocks": sum(row.count(b"?") for row in tiles),
+        "reachable": analyze_level(data)["solvable"] if solve else None,
+    }
+
+SWEEP_DENSITY = 2.0     # enemies per screen a level is scored against
+
+def level_score(m):
+    """One number to rank levels by; unreachable levels score None"""
+    if m["reachable"] is False: return None
+    return round(m["qblocks"] + 2 * m["gaps"] - 4 * abs(m["enemies_per_screen"] - SWEEP_DENSITY), 3)
+
+# ╔═══════════════════════════════════════════════════════════════════════════════╗
+# ║ ENDLESS STREAM                                                                ║
+# ╚═══════════════════════════════════════════════════════════════════════════════╝
+STREAM_COLS = 4 * CHUNK_COLS    # columns generated at a time
+STREAM_ROWS = 15
+STREAM_RAMP = 8                 # segments per step up in difficulty (world), up to 8
+STREAM_TRIES = 8                # rerolls for a segment analyze_level can't cross before laying flat ground
+STREAM_PIPE = 3                 # tallest pipe, in tiles: a jump clears it without climbing anything (check)
+STREAM_BG_WIDTH = 4096          # parallax period, as the map's own width keeps growing
+
+def generate_segment(rng, world=1, first=False):
+    """One STREAM_COLS-wide slice of endless level from generate_level's building blocks, with pipes
+    no taller than a jump clears, rerolled until analyze_level can cross it: (rows, enemies,
+    contents by local (x, y))"""
+    w, gy = STREAM_COLS, STREAM_ROWS - 2
+    lo = 20 if first else 1
+    for _ in range(STREAM_TRIES):
+        tiles = [bytearray(b" " * w) for _ in range(STREAM_ROWS)]
+        _lay_ground(tiles, rng, gy, 0.02 * world, max(lo, 2), w - 3)
+        _lay_platforms(tiles, rng, w // 15, lo, w - 7, gy)
+        qblocks = _lay_qblocks(tiles, rng, w // 12, lo, w - 2, gy)
+        _lay_bricks(tiles, rng, w // 8, lo, w - 5, gy)
+        _lay_pipes(tiles, rng, w // 25, lo, w - 3, gy, STREAM_PIPE)
+        crossing = {"tiles": tiles, "player_start": (0, (gy - 1) * TILE), "flag_pos": ((w - 1) * TILE + 24, 0)}
+        if analyze_level(crossing)["solvable"]:
+            break
+    else:
+        tiles = [bytearray(b" " * w) for _ in range(gy)] + [bytearray(b"G" * w), bytearray(b"D" * w)]
+        qblocks = []
+    enemies = _lay_enemies(rng, (8 + world * 2) * w // (150 + world * 20), lo, w - 2, gy)
+    return tiles, sorted(enemies, key=lambda e: e["x"]), _block_contents(rng, qblocks)
+
+class StreamingTileMap(TileMap):
+    """Endless TileMap: segments are generated ahead of the camera and those a screen behind the
+    player are dropped, so tiles, colliders and chunks stay bounded. Given submit (an executor's
+    submit), the segment after the newest is generated on that worker while the player crosses
+    the ones already laid"""
+    
+    def __init__(self, world=1, seed=0, effects=None, items=None, bake_background=False, merge_colliders=False,
+                 submit=None):
+        super().__init__({"tiles": [b""] * STREAM_ROWS, "width": 0, "theme": world},
+                         [] if effects is None else effects, [] if items is None else items,
+                         bake_background, merge_colliders)
+        self.world = world
+        self.rng = random.Random(seed)
+        self.segments = 0
+        self.bg_width = STREAM_BG_WIDTH
+        self.submit = submit
+        self.pending = None
+        
+    def stream(self, player_x, ahead_x):
+        """Generate until the map covers ahead_x plus a segment, drop segments wholly more than a
+        screen behind player_x; returns the new segments' enemies in x order"""
+        seg_w = STREAM_COLS * TILE
+        spawned = []
+        while self.width < ahead_x + seg_w:
+            spawned += self._add_segment()
+        while self.left + seg_w < player_x - WIDTH:
+            self._drop_segment()
+        return spawned
+        
+    def respawn_point(self, x):
+        """Where a player can stand on open ground under open sky, at or after x: headroom alone can
+        put them in a pocket under a platform whose only way out is over the top"""
+        gy = STREAM_ROWS - 2
+        tx = max(int(x), self.left) // TILE
+        while tx < self.width // TILE - 2:
+            if all((c, gy) in self.cells and not any((c, y) in self.cells for y in range(gy))
+                   for c in (tx, tx + 1)):
+                break
+            tx += 1
+        return tx * TILE, (gy - 1) * TILE
+        
+    def _segment_args(self, n):
+        return self.rng, min(8, self.world + n // STREAM_RAMP), n == 0
+        
+    def _add_segment(self):
+        # The worker holds rng while a segment is pending, so segments still draw from it in order
+        x0 = self.segments * STREAM_COLS
+        if self.pending is None:
+            tiles, enemies, contents = generate_segment(*self._segment_args(self.segments))
+        else:
+            tiles, enemies, contents = self.pending.result()
+        if self.submit is not None:
+            self.pending = self.submit(generate_segment, *self._segment_args(self.segments + 1))
+        self._add_tiles(tiles, x0, {f"{x0 + x},{y}": c for (x, y), c in contents.items()})
+        self.segments += 1
+        self.width = self.segments * STREAM_COLS * TILE
+        for e in enemies:
+            e["x"] += x0 * TILE
+        return enemies
+        
+    def _drop_segment(self):
+        x0 = self.left // TILE
+        x1 = x0 + STREAM_COLS
+        self.left = x1 * TILE
+        self.tiles = [t for t in self.tiles if t[0] >= self.left]
+        self.colliders = [r for r in self.colliders if r.x >= self.left]
+        for x in range(x0, x1):
+            for y in range(STREAM_ROWS):
+                self.cells.pop((x, y), None)
+                self.merged_at.pop((x, y), None)
+                self.qblocks.pop((x * TILE, y * TILE), None)
+                self.bricks.discard((x * TILE, y * TILE))
+        for ci in range(x0 // CHUNK_COLS, x1 // CHUNK_COLS):
+            self.chunk_tiles.pop(ci, None)
+            self.chunks.pop(ci, None)
+
+PILOT_BACKOFFS = (0, 10, 20, 40)        # frames of run-up away from the target a move may start with
+PILOT_HOLDS = (0, 30, 20, 12, 6, 2)     # frames the jump button is held; 0 walks (or falls) without one
+PILOT_RELEASES = (99, 20, 12, 6, 0)     # frames after the jump the direction is let go, trimming air speed
+PILOT_BEHIND = 8                        # columns behind the player kept in the pilot's view of the map
+PILOT_LANDINGS = 60                     # first-move landings a two-move search goes on from
+
+class TileProbe:
+    """A TileMap as seen by a copy of the player trying out a move: blocks it hits stay as they are"""
+    
+    def __init__(self, tmap):
+        self.tmap = tmap
+        
+    def __getattr__(self, name):
+        return getattr(self.tmap, name)
+        
+    def hit_block(self, bx, by, player):
+        pass
+
+def _pilot_moves(toward, backoffs):
+    away = IN_LEFT if toward == IN_RIGHT else IN_RIGHT
+    for back in backoffs:
+        for run in (IN_RUN, 0):
+            for hold in PILOT_HOLDS:
+                for release in PILOT_RELEASES:
+                    for jump_at in range(48 + back if hold else 1):
+                        yield hold, [away | run] * back + [
+                            (toward if f < jump_at + release else 0) | run | (IN_JUMP if hold and jump_at <= f < jump_at + hold else 0)
+                            for f in range(jump_at + 120)]
+
+def _try_move(player, probe, script, hold, done):
+    """Play script on a copy of player: (copy, frames) as soon as done(copy), (copy, -frames) where a
+    jump lands or the script runs out, (None, frames) if it falls out of the map"""
+    p = copy.copy(player)
+    p._rect = pygame.Rect(0, 0, 0, 0)
+    keys = ScriptedKeys()
+    rose = False
+    for i, mask in enumerate(script):
+        keys.mask = mask
+        p.update(keys, probe, [], [], SIM_DT)
+        if p.y > probe.height:
+            return None, i + 1
+        if done(p):
+            return p, i + 1
+        if p.vy < 0:
+            rose = True
+        elif hold and rose and p.on_ground:
+            return p, -(i + 1)
+    return p, -len(script)
+
+def find_move(player, tmap, cell, depth=2):
+    """Inputs that take player by the real physics to stand in cell (on its row, give or take a
+    column), else None: one move (run-up, then a walk or jump), or at depth 2 failing that, a move
+    to some landing and one without run-up from there, for jumps that need the speed they land with"""
+    probe = TileProbe(tmap)
+    c, r = cell
+    toward = IN_RIGHT if c * TILE + 2 > player.x else IN_LEFT
+    
+    def done(p):
+        ix = int(p.x)
+        return p.on_ground and int(p.y) + p.h == (r + 1) * TILE and ix // TILE - 1 <= c <= (ix + p.w - 1) // TILE + 1
+        
+    landings = {}
+    for hold, script in _pilot_moves(toward, PILOT_BACKOFFS if depth > 1 else (0,)):
+        p, n = _try_move(player, probe, script, hold, done)
+        if p is None:
+            continue
+        if n > 0:
+            return script[:n]
+        if depth > 1 and p.on_ground and len(landings) < PILOT_LANDINGS:
+            landings.setdefault((int(p.x), int(p.y), round(p.vx, 1)), (p, script[:-n]))
+    for p, first in landings.values():
+        second = find_move(p, tmap, cell, 1)
+        if second is not None:
+            return first + second
+    return None
+
+class StreamPilot:
+    """Plays endless mode along the crossing analyze_level finds, so a run shows every segment can be
+    crossed by the real physics: standing, it walks as far along the path's row as it goes, else
+    takes the path's next step, with inputs from find_move. A script (frame -> input mask) whose
+    plan() runs between frames; stuck is the column where the path or a move to it ran out"""
+    
+    def __init__(self, engine):
+        self.engine = engine
+        self.player = None
+        self.inputs = []
+        self.stuck = None
+        
+    def __call__(self, frame):
+        return self.inputs.pop() if self.inputs else 0
+        
+    def plan(self):
+        p, tmap = self.engine.player, self.engine.tmap
+        if p is not self.player:
+            self.player, self.inputs = p, []
+        if self.inputs or p.dead or not p.on_ground:
+            return
+        cells = tmap.cells
+        r = (int(p.y) + p.h - 1) // TILE
+        ix = int(p.x)
+        c = ix // TILE if (ix // TILE, r + 1) in cells else (ix + p.w - 1) // TILE
+        c0 = max(tmap.left // TILE, c - PILOT_BEHIND)
+        w = tmap.width // TILE - c0
+        solid, air = b"G "
+        rows = [bytes(solid if (c0 + x, y) in cells else air for x in range(w)) for y in range(STREAM_ROWS)]
+        path = analyze_level({"tiles": rows, "player_start": ((c - c0) * TILE, r * TILE),
+                              "flag_pos": ((w - 1) * TILE + 24, 0)})["path"]
+        if len(path) < 2:
+            self.stuck = c
+            return
+        i = 1
+        while i < len(path) and path[i] == (path[i - 1][0] + 1, path[i - 1][1]):
+            i += 1
+        tx, ty = path[i - 1] if i > 1 else path[1]
+        inputs = find_move(p, tmap, (tx + c0, ty))
+        if inputs is None:
+            self.stuck = c
+        else:
+            self.inputs = inputs[::-1]
+
+# ╔═══════════════════════════════════════════════════════════════════════════════╗
+# ║ LEVEL FILES                                                                   ║
+# ╚═══════════════════════════════════════════════════════════════════════════════╝
+# .kpl v1, little-endian: header, tile grid as (count, tile) byte runs in row-major
+# order, enemy table, ? block contents table, then a crc32 of everything before it
+KPL_MAGIC = b"KPLV"
+KPL_VERSION = 1
+KPL_HEADER = struct.Struct("<4sHBBHHIiiiiqIII")
+KPL_ENEMY = struct.Struct("<iiB")
+KPL_CONTENT = struct.Struct("<HHB")
+KPL_CRC = struct.Struct("<I")
+KPL_ENEMY_TYPES = ("goomba", "koopa", "piranha")
+KPL_CONTENTS = ("coin", "mushroom")
+KPL_RUNS = [bytes((b,)) * 255 for b in range(256)]
+
+def _rle(grid):
+    out = bytearray()
+    i, n = 0, len(grid)
+    while i < n:
+        b = grid[i]
+        j = i + 1
+        while j < n and j - i < 255 and grid[j] == b:
+            j += 1
+        out += bytes((j - i, b))
+        i = j
+    return out
+
+def encode_kpl(data):
+    """Level data (generate_level/to_game format) as .kpl bytes"""
+    rows = level_rows(data["tiles"])
+    h, w = len(rows), len(rows[0])
+    runs = _rle(b"".join(rows))
+    enemies = data.get("enemies", [])
+    bc = data.get("block_contents", {})
+    seed = data.get("seed")
+    unknown = {e["type"] for e in enemies}.difference(KPL_ENEMY_TYPES) | set(bc.values()).difference(KPL_CONTENTS)
+    if unknown:
+        raise ValueError(f"can't store {', '.join(sorted(unknown))} in a .kpl")
+    try:
+        out = bytearray(KPL_HEADER.pack(
+            KPL_MAGIC, KPL_VERSION, data.get("theme", 1), seed is not None, w, h, data.get("width", w * TILE),
+            int(data["player_start"][0]), int(data["player_start"][1]),
+            int(data["flag_pos"][0]), int(data["flag_pos"][1]), seed or 0, len(runs), len(enemies), len(bc)))
+        out += runs
+        for e in enemies:
+            out += KPL_ENEMY.pack(int(e["x"]), int(e["y"]), KPL_ENEMY_TYPES.index(e["type"]))
+        for k, c in bc.items():
+            x, y = map(int, k.split(","))
+            out += KPL_CONTENT.pack(x, y, KPL_CONTENTS.index(c))
+    except struct.error as err:
+        raise ValueError(f"level doesn't fit the .kpl format: {err}") from None
+    out += KPL_CRC.pack(zlib.crc32(out))
+    return bytes(out)
+
+def decode_kpl(buf):
+    """Level data from .kpl bytes (or an mmap of them); tile rows come back as bytes"""
+    if len(buf) < KPL_HEADER.size + KPL_CRC.size:
+        raise ValueError("truncated .kpl")
+    (magic, version, theme, has_seed, w, h, width, px, py, fx, fy, seed,
+     n_runs, n_enemies, n_bc) = KPL_HEADER.unpack_from(buf)
+    if magic != KPL_MAGIC or version != KPL_VERSION:
+        raise ValueError(f"not a v{KPL_VERSION} .kpl level")
+    end = KPL_HEADER.size + n_runs + n_enemies * KPL_ENEMY.size + n_bc * KPL_CONTENT.size
+    if len(buf) != end + KPL_CRC.size:
+        raise ValueError("truncated .kpl")
+    with memoryview(buf) as mv:
+        crc = zlib.crc32(mv[:end])
+    if KPL_CRC.unpack_from(buf, end)[0] != crc:
+        raise ValueError(".kpl checksum mismatch")
+    off = KPL_HEADER.size
+    runs = buf[off:off + n_runs]
+    grid = b"".join([KPL_RUNS[b][:n] for n, b in zip(runs[::2], runs[1::2])])
+    if len(grid) != w * h:
+        raise ValueError(".kpl tile data doesn't match its size")
+    off += n_runs
+    enemies = [{"x": x, "y": y, "type": KPL_ENEMY_TYPES[t]}
+               for x, y, t in KPL_ENEMY.iter_unpack(buf[off:off + n_enemies * KPL_ENEMY.size])]
+    off += n_enemies * KPL_ENEMY.size
+    bc = {f"{x},{y}": KPL_CONTENTS[c] for x, y, c in KPL_CONTENT.iter_unpack(buf[off:end])}
+    data = {
+        "tiles": [grid[y * w:(y + 1) * w] for y in range(h)],
+        "enemies": enemies,
+        "player_start": (px, py),
+        "flag_pos": (fx, fy),
+        "width": width,
+        "block_contents": bc,
+        "theme": theme,
     }
+    if has_seed:
+        data["seed"] = seed
+    return data
+
+def load_kpl(path):
+    """Memory-map a .kpl file and decode it; older repr() text saves are still read (safely)"""
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if mm[:len(KPL_MAGIC)] != KPL_MAGIC:
+            return ast.literal_eval(mm[:].decode())
+        return decode_kpl(mm)
+
+def save_kpl(data, path):
+    with open(path, "wb") as f:
+        f.write(encode_kpl(data))
+
+LEVEL_ARCHIVE = "levels.kpa"
+
+class LevelArchive:
+    """Many .kpl levels in one memory-mapped file behind a fixed-size index; a level is only
+    decoded when it is asked for"""
+    MAGIC = b"KPAR"
+    VERSION = 1
+    HEADER = struct.Struct("<4sHHI")        # magic, version, index entry size, entry count
+    ENTRY = struct.Struct("<32sII")         # NUL-padded name, offset, length
+    
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.mm) < self.HEADER.size:
+            raise ValueError(f"{path}: not a level archive")
+        magic, version, entry_size, n = self.HEADER.unpack_from(self.mm)
+        if magic != self.MAGIC or version != self.VERSION or entry_size != self.ENTRY.size:
+            raise ValueError(f"{path}: not a v{self.VERSION} level archive")
+        end = self.HEADER.size + n * entry_size
+        if end > len(self.mm):
+            raise ValueError(f"{path}: truncated index")
+        self.index = {}
+        for name, off, size in self.ENTRY.iter_unpack(self.mm[self.HEADER.size:end]):
+            if off + size > len(self.mm):
+                raise ValueError(f"{path}: truncated archive")
+            self.index[name.rstrip(b"\0").decode()] = (off, size)
+            
+    def __contains__(self, name):
+        return name in self.index
+        
+    def names(self):
+        return list(self.index)
+        
+    def get(self, name):
+        off, size = self.index[name]
+        return decode_kpl(self.mm[off:off + size])
+        
+    def seed(self, name):
+        """The seed a level was generated from (None if hand-made), read from its header alone"""
+        fields = KPL_HEADER.unpack_from(self.mm, self.index[name][0])
+        return fields[11] if fields[3] else None
+        
+    def close(self):
+        self.mm.close()
+        
+    @classmethod
+    def write(cls, path, levels):
+        """Pack {name: level data} into an archive; written aside and swapped in, so a copy that is
+        mapped elsewhere stays readable"""
+        blobs = [(name.encode(), encode_kpl(data)) for name, data in levels.items()]
+        for name, _ in blobs:
+            if not 0 < len(name) <= 32:
+                raise ValueError(f"level name {name.decode()!r} doesn't fit the archive index")
+        off = cls.HEADER.size + len(blobs) * cls.ENTRY.size
+        out = bytearray(cls.HEADER.pack(cls.MAGIC, cls.VERSION, cls.ENTRY.size, len(blobs)))
+        for name, blob in blobs:
+            out += cls.ENTRY.pack(name, off, len(blob))
+            off += len(blob)
+        for _, blob in blobs:
+            out += blob
+        with open(path + ".tmp", "wb") as f:
+            f.write(out)
+        os.replace(path + ".tmp", path)
+        return len(out)
+
+def pack_levels(worlds=range(1, 9), levels=range(1, 5), seeds_path=None, custom_dir=None):
+    """{name: level data} for an archive: every world-level slot ("1-1".."8-4"), generated from
+    the best swept seed when a sweep results file is given, plus each .kpl in custom_dir under its
+    file name (so levels/2-3.kpl replaces slot 2-3)"""
+    best = {}
+    if seeds_path:
+        with open(seeds_path) as f:
+            best = {key: entries[0]["seed"] for key, entries in json.load(f)["levels"].items() if entries}
+    packed = {}
+    for w in worlds:
+        for l in levels:
+            packed[f"{w}-{l}"] = generate_level(w, l, best.get(f"{w}-{l}"))
+    if custom_dir:
+        for fn in sorted(os.listdir(custom_dir)):
+            if fn.endswith(".kpl"):
+                packed[fn[:-4]] = load_kpl(os.path.join(custom_dir, fn))
+    return packed
 
 # ╔═══════════════════════════════════════════════════════════════════════════════╗
 # ║ EDITABLE LEVEL                                                                ║
 # ╚═══════════════════════════════════════════════════════════════════════════════╝
 class EditableLevel:
+    """Editor level: tiles in a row-major bytearray, enemies and ? block contents keyed by cell"""
+    
     def __init__(self, w=100, h=15, theme=1):
         self.w, self.h, self.theme = w, h, theme
-        self.tiles = {}
-        self.enemies = []
+        self.grid = bytearray(b" " * (w * h))
+        self.enemy_at = {}
         self.player_start = (3, h - 3)
         self.flag_pos = (w - 10, h - 10)
         self.block_contents = {}
         self.name = "Custom Level"
-        for x in range(w):
-            self.tiles[(x, h - 2)] = "G"
-            self.tiles[(x, h - 1)] = "D"
-            
+        self.rev = 0
+        self.grid[(h - 2) * w:(h - 1) * w] = b"G" * w
+        self.grid[(h - 1) * w:] = b"D" * w
+        
+    @classmethod
+    def from_game(cls, data):
+        """Editable copy of level data in the to_game()/generate_level format"""
+        rows = data["tiles"]
+        lv = cls(len(rows[0]), len(rows), data.get("theme", 1))
+        lv.grid[:] = b"".join(level_rows(rows))
+        for e in data.get("enemies", []):
+            lv.enemy_at[(int(e["x"]) // TILE, int(e["y"]) // TILE)] = e["type"]
+        lv.block_contents = {tuple(map(int, k.split(","))): c for k, c in data.get("block_contents", {}).items()}
+        lv.player_start = (int(data["player_start"][0]) // TILE, int(data["player_start"][1]) // TILE)
+        lv.flag_pos = (int(data["flag_pos"][0]) // TILE, int(data["flag_pos"][1]) // TILE)
+        return lv
+        
+    @property
+    def enemies(self):
+        return [{"x": x, "y": y, "type": t} for (x, y), t in self.enemy_at.items()]
+        
+    def get_tile(self, x, y):
+        if 0 <= x < self.w and 0 <= y < self.h:
+            c = self.grid[y * self.w + x]
+            if c != 32:
+                return chr(c)
+        return None
+        
     def set_tile(self, x, y, tid):
         if 0 <= x < self.w and 0 <= y < self.h:
+            self.rev += 1
+            i = y * self.w + x
             if tid in (" ", None):
-                self.tiles.pop((x, y), None)
+                self.grid[i] = 32
                 self.block_contents.pop((x, y), None)
             elif tid == "?M":
-                self.tiles[(x, y)] = "?"
+                self.grid[i] = ord("?")
                 self.block_contents[(x, y)] = "mushroom"
             elif tid == "?C":
-                self.tiles[(x, y)] = "?"
+                self.grid[i] = ord("?")
                 self.block_contents[(x, y)] = "coin"
             else:
-                self.tiles[(x, y)] = tid
+                self.grid[i] = ord(tid)
                 if tid == "?":
                     self.block_contents[(x, y)] = "coin"
                     
     def add_enemy(self, x, y, etype):
-        self.enemies = [e for e in self.enemies if not (e["x"] == x and e["y"] == y)]
-        self.enemies.append({"x": x, "y": y, "type": etype})
+        self.rev += 1
+        self.enemy_at.pop((x, y), None)
+        self.enemy_at[(x, y)] = etype
         
+    def get_cell(self, x, y):
+        """Everything stored at a cell: (tile, block contents, enemy type)"""
+        return self.get_tile(x, y), self.block_contents.get((x, y)), self.enemy_at.get((x, y))
+        
+    def set_cell(self, x, y, cell):
+        tile, contents, enemy = cell
+        self.remove_at(x, y)
+        if tile is not None:
+            self.set_tile(x, y, tile)
+        if contents is not None:
+            self.block_contents[(x, y)] = contents
+        if enemy is not None:
+            self.enemy_at[(x, y)] = enemy
+            
     def remove_at(self, x, y):
-        self.tiles.pop((x, y), None)
+        self.rev += 1
+        if 0 <= x < self.w and 0 <= y < self.h:
+            self.grid[y * self.w + x] = 32
         self.block_contents.pop((x, y), None)
-        self.enemies = [e for e in self.enemies if not (e["x"] == x and e["y"] == y)]
+        self.enemy_at.pop((x, y), None)
         
     def to_game(self):
-        rows = []
-        for y in range(self.h):
-            row = ""
-            for x in range(self.w):
-                row += self.tiles.get((x, y), " ")
-            rows.append(row)
-        enemies = [{"x": e["x"] * TILE, "y": e["y"] * TILE, "type": e["type"]} for e in self.enemies]
+        w = self.w
+        rows = [self.grid[y * w:(y + 1) * w].decode() for y in range(self.h)]
+        enemies = [{"x": x * TILE, "y": y * TILE, "type": t} for (x, y), t in self.enemy_at.items()]
         bc = {f"{x},{y}": c for (x, y), c in self.block_contents.items()}
         return {
             "tiles": rows,
@@ -911,49 +2043,71 @@ class EditableLevel:
         
     def to_code(self):
         """Generate Python code for standalone game"""
-        data = self.to_game()
-        return f'''LEVEL_DATA = {{
-    "tiles": {data["tiles"]!r},
-    "enemies": {data["enemies"]!r},
-    "player_start": {data["player_start"]!r},
-    "flag_pos": {data["flag_pos"]!r},
-    "width": {data["width"]},
-    "block_contents": {data["block_contents"]!r},
-    "theme": {data["theme"]}
-}}'''
+        return level_code(self.to_game())
 
 # ╔═══════════════════════════════════════════════════════════════════════════════╗
 # ║ UNDO SYSTEM                                                                   ║
 # ╚═══════════════════════════════════════════════════════════════════════════════╝
 class Undo:
+    """Delta undo: each entry holds only the cells an edit stroke changed, as key -> (before, after).
+    Keys are (x, y) cells or "player" / "flag"; touch() before a change, commit() at the end of a stroke"""
+    
     def __init__(self, max_h=50):
         self.hist = []
         self.future = []
         self.max = max_h
+        self.stroke = None
+        
+    @staticmethod
+    def _get(lv, key):
+        if key == "player": return lv.player_start
+        if key == "flag": return lv.flag_pos
+        return lv.get_cell(*key)
         
-    def save(self, lv):
-        s = {"tiles": dict(lv.tiles), "enemies": list(lv.enemies),
-             "ps": lv.player_start, "fp": lv.flag_pos, "bc": dict(lv.block_contents)}
-        self.hist.append(s)
+    @staticmethod
+    def _set(lv, key, value):
+        if key == "player": lv.player_start = value
+        elif key == "flag": lv.flag_pos = value
+        else: lv.set_cell(*key, value)
+        lv.rev += 1
+        
+    def touch(self, lv, key):
+        """Remember key's state before the current stroke first changes it"""
+        if self.stroke is None:
+            self.stroke = {}
+        if key not in self.stroke:
+            self.stroke[key] = self._get(lv, key)
+            
+    def commit(self, lv):
+        """Close the current stroke as one undo entry, keeping only keys that really changed"""
+        stroke, self.stroke = self.stroke, None
+        if not stroke: return
+        delta = {}
+        for key, before in stroke.items():
+            after = self._get(lv, key)
+            if after != before:
+                delta[key] = (before, after)
+        if not delta: return
+        self.hist.append(delta)
         self.future.clear()
         if len(self.hist) > self.max:
             self.hist.pop(0)
             
     def undo(self, lv):
-        if len(self.hist) > 1:
-            self.future.append(self.hist.pop())
-            s = self.hist[-1]
-            lv.tiles, lv.enemies = dict(s["tiles"]), list(s["enemies"])
-            lv.player_start, lv.flag_pos = s["ps"], s["fp"]
-            lv.block_contents = dict(s["bc"])
-            
+        self.commit(lv)
+        if self.hist:
+            delta = self.hist.pop()
+            self.future.append(delta)
+            for key, (before, _) in delta.items():
+                self._set(lv, key, before)
+                
     def redo(self, lv):
+        self.commit(lv)
         if self.future:
-            s = self.future.pop()
-            self.hist.append(s)
-            lv.tiles, lv.enemies = dict(s["tiles"]), list(s["enemies"])
-            lv.player_start, lv.flag_pos = s["ps"], s["fp"]
-            lv.block_contents = dict(s["bc"])
+            delta = self.future.pop()
+            self.hist.append(delta)
+            for key, (_, after) in delta.items():
+                self._set(lv, key, after)
 
 # ╔═══════════════════════════════════════════════════════════════════════════════╗
 # ║ PALETTE                                                                       ║
@@ -966,11 +2120,90 @@ PALETTE = {
 }
 PAL_CATS = ["terrain", "blocks", "enemies", "special"]
 
+# ╔═══════════════════════════════════════════════════════════════════════════════╗
+# ║ FRAME PROFILER                                                                ║
+# ╚═══════════════════════════════════════════════════════════════════════════════╝
+PROFILE_PHASES = ("events", "player", "enemies", "items", "effects", "stream", "tilemap", "entities", "hud", "flip")
+PROFILE_FRAMES = 240
+
+class FrameProfiler:
+    """Rolling per-phase timings for the F3 overlay; every call is a no-op while hidden"""
+    def __init__(self):
+        self.on = False
+        self.hist = {p: deque(maxlen=PROFILE_FRAMES) for p in PROFILE_PHASES}
+        self.frame_ms = deque(maxlen=PROFILE_FRAMES)
+        self.cur = dict.fromkeys(PROFILE_PHASES, 0.0)
+        self.t0 = self.t = 0.0
+        
+    def toggle(self):
+        """Show or hide; timing restarts from now so the frame F3 lands in isn't measured from 0"""
+        self.on = not self.on
+        self.t0 = self.t = time.perf_counter()
+        
+    def begin(self):
+        if self.on:
+            self.t0 = self.t = time.perf_counter()
+            
+    def lap(self, phase):
+        """Charge the time since the previous lap to phase"""
+        if self.on:
+            now = time.perf_counter()
+            self.cur[phase] += now - self.t
+            self.t = now
+            
+    def skip(self):
+        if self.on:
+            self.t = time.perf_counter()
+            
+    def end(self):
+        if self.on:
+            self.frame_ms.append((time.perf_counter() - self.t0) * 1000)
+            for p, secs in self.cur.items():
+                self.hist[p].append(secs * 1000)
+                self.cur[p] = 0.0
+                
+    def percentiles(self):
+        ms = sorted(self.frame_ms)
+        if not ms:
+            return 0.0, 0.0, 0.0
+        return tuple(ms[min(len(ms) - 1, int(len(ms) * q))] for q in (0.50, 0.95, 0.99))
+
+# ╔═══════════════════════════════════════════════════════════════════════════════╗
+# ║ FONTS & TEXT CACHE                                                            ║
+# ╚═══════════════════════════════════════════════════════════════════════════════╝
+TEXT_CACHE_SIZE = 256
+_fonts = {}
+_text_cache = OrderedDict()
+
+def get_font(name, size, bold=False):
+    """SysFont lookups scan system fonts, so each (name, size, bold) is loaded once"""
+    key = (name, size, bold)
+    font = _fonts.get(key)
+    if font is None:
+        font = _fonts[key] = pygame.font.SysFont(name, size, bold=bold)
+    return font
+
+def render_text(font, text, color):
+    """Rendered label, re-rendered only when the text or colour changes (LRU)"""
+    key = (font, text, color)
+    surf = _text_cache.get(key)
+    if surf is None:
+        surf = _text_cache[key] = font.render(text, True, color)
+        if len(_text_cache) > TEXT_CACHE_SIZE:
+            _text_cache.popitem(last=False)
+    else:
+        _text_cache.move_to_end(key)
+    return surf
+
 # ╔═══════════════════════════════════════════════════════════════════════════════╗
 # ║ GAME ENGINE                                                                   ║
 # ╚═══════════════════════════════════════════════════════════════════════════════╝
 class KoopaEngine:
-    def __init__(self):
+    def __init__(self, headless=False, archive=None):
+        self.headless = headless
+        if headless:
+            os.environ["SDL_VIDEODRIVER"] = "dummy"
+            os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
         pygame.init()
         self.screen = pygame.display.set_mode((WIDTH, HEIGHT))
         pygame.display.set_caption("AC!'s KOOPA ENGINE 1.1 — Team Flames / Samsoft")
@@ -983,17 +2216,19 @@ class KoopaEngine:
         # Editor
         self.edit_lv = EditableLevel()
         self.undo = Undo()
-        self.undo.save(self.edit_lv)
         self.pal_cat = 0
         self.pal_idx = 0
         self.edit_cam = 0
         self.show_grid = True
         self.show_help = False
+        self.edit_reach = None
+        self.edit_check = None
+        self.level_file = None
         
         # Title
         self.title_timer = 0
         self.title_idx = 0
-        self.title_opts = ["START GAME", "LEVEL EDITOR", "QUIT"]
+        self.title_opts = ["START GAME", "ENDLESS", "LEVEL EDITOR", "QUIT"]
         
         # World map
         self.map_world = 1
@@ -1001,16 +2236,177 @@ class KoopaEngine:
         # Game
         self.effects = []
         self.items = []
+        self.bake_background = False
+        self.merge_colliders = False
+        self.spawn_margin = SPAWN_MARGIN
+        self.endless = False
+        self.archive = LevelArchive(archive) if archive else None
+        self.preload = LevelPreloader(archive=self.archive)
+        self.render_fps = FPS
+        self.alpha = 1.0
+        self.prev_cam = 0
+        
+        # Scripted input (None = keyboard) and recording
+        self.script = None
+        self.script_keys = ScriptedKeys()
+        self.frame = 0
+        self.record_path = None
+        self.recording = None
+        self.level_seed = self.rng_seed = None
+        self.rng = random.Random()
+        
+        # F3 profiler overlay
+        self.prof = FrameProfiler()
+        self.prof_lines = []
         
     def run(self):
+        # Fixed 60 Hz simulation; rendering runs at render_fps (0 = uncapped)
+        # and interpolates between the last two simulated states
+        acc = 0.0
+        prof = self.prof
         while self.running:
-            dt = self.clock.tick(FPS) / 1000.0
+            acc = min(acc + self.clock.tick(self.render_fps) / 1000.0, SIM_DT * MAX_SIM_STEPS)
+            prof.begin()
             self.handle_events()
-            self.update(dt)
+            prof.lap("events")
+            while acc >= SIM_DT:
+                self.step()
+                acc -= SIM_DT
+            if self.mode != "game":
+                # Left the recorded level (map, title, editor or game over): the replay ends here
+                self._save_recording()
+            self.alpha = acc / SIM_DT
+            prof.skip()
             self.draw()
+            prof.skip()
             pygame.display.flip()
+            prof.lap("flip")
+            prof.end()
+        self._save_recording()
         pygame.quit()
         
+    def step(self):
+        """Advance the simulation by exactly one fixed timestep"""
+        if self.mode == "game":
+            for e in self._movers():
+                e.px, e.py = e.x, e.y
+            self.prev_cam = self.cam
+        self.update(SIM_DT)
+        
+    def _movers(self):
+        return [self.player] + self.enemies + self.items + self.effects
+        
+    def simulate(self, frames, world=1, level=1, script=autoplay, draw=False, seed=None):
+        """Fast-forward a level with no frame limiter; reports simulated frames per wall-second"""
+        state.reset()
+        self._start_level(world, level, seed)
+        self._begin_recording(restart=True)
+        return self._fast_forward(frames, script, draw, restart=(world, level, seed))
+        
+    def soak_endless(self, frames, world=1, seed=0, draw=False, stall_frames=300):
+        """Endless-mode stress run: a StreamPilot plays with unlimited lives, and the run stops early
+        (stuck at its column) where the pilot finds no move or the living player makes no progress
+        for stall_frames; reports sim speed (pilot planning timed apart), distance, the largest live
+        counts seen and the mean step time over the first and last tenth of the run"""
+        state.reset()
+        state.world = world
+        state.lives = 1 << 30
+        self._start_endless(seed)
+        pilot = StreamPilot(self)
+        self.script = pilot
+        peak = dict.fromkeys(("tiles", "colliders", "chunks", "spawn_table", "enemies", "items"), 0)
+        tenth = max(1, frames // 10)
+        first = last = planning = 0.0
+        best_x, stalled, stuck = 0.0, 0, None
+        t = time.perf_counter()
+        for i in range(frames):
+            if state.powerup:
+                # The analyzer's crossings are for the small player
+                state.powerup = 0
+                self.player.update_size()
+            t0 = time.perf_counter()
+            pilot.plan()
+            planning += time.perf_counter() - t0
+            if pilot.stuck is not None:
+                stuck, frames = pilot.stuck, i
+                break
+            t0 = time.perf_counter()
+            self.step()
+            if draw:
+                self.draw()
+            ms = (time.perf_counter() - t0) * 1000
+            if i < tenth: first += ms
+            if i >= frames - tenth: last += ms
+            p, tmap = self.player, self.tmap
+            if p.x > best_x + 1:
+                best_x, stalled = p.x, 0
+            elif not p.dead:
+                stalled += 1
+            if stalled >= stall_frames:
+                stuck, frames = int(p.x) // TILE, i + 1
+                break
+            for name, n in (("tiles", len(tmap.tiles)), ("colliders", len(tmap.colliders)),
+                            ("chunks", len(tmap.chunks)), ("spawn_table", len(self.spawn_table)),
+                            ("enemies", len(self.enemies)), ("items", len(self.items))):
+                if n > peak[name]: peak[name] = n
+        elapsed = time.perf_counter() - t - planning
+        self.script = None
+        return {"frames": frames, "seconds": elapsed, "fps": frames / elapsed if elapsed else 0.0,
+                "planning": planning, "distance": int(best_x) // TILE, "stuck": stuck, "peak": peak,
+                "first_ms": first / tenth, "last_ms": last / tenth}
+        
+    def play_replay(self, replay, draw=False):
+        """Re-run a recorded session exactly, as fast as possible; ValueError if the level loaded
+        isn't the one it was recorded on"""
+        state.reset()
+        state.lives, state.powerup, state.coins = replay.lives, replay.powerup, replay.coins
+        self._start_level(replay.world, replay.level, replay.seed)
+        if self.rng_seed != replay.rng_seed:
+            raise ValueError(f"level {replay.world}-{replay.level} isn't the one this replay was recorded on")
+        restart = (replay.world, replay.level, replay.seed) if replay.restart else None
+        return self._fast_forward(len(replay.inputs), replay.script(), draw, restart)
+        
+    def _fast_forward(self, frames, script, draw, restart=None):
+        self.script = script
+        done = 0
+        t = time.perf_counter()
+        while done < frames:
+            self.step()
+            done += 1
+            if self.mode != "game":
+                if restart is None: break
+                self._start_level(*restart)
+            if draw:
+                self.draw()
+        elapsed = time.perf_counter() - t
+        self.script = None
+        return {"frames": done, "seconds": elapsed, "fps": done / elapsed if elapsed else 0.0,
+                "score": state.score, "world": state.world, "level": state.level}
+        
+    def _begin_recording(self, restart=False):
+        if self.record_path:
+            self._save_recording()
+            self.recording = Replay(state.world, state.level, self.level_seed,
+                                    state.lives, state.powerup, state.coins, restart,
+                                    self.archive.path if self.archive is not None else None, self.rng_seed)
+            
+    def _save_recording(self):
+        """Write out and stop the current recording; a later session overwrites the file"""
+        if self.recording is not None:
+            self.recording.save(self.record_path)
+            print(f"Recorded {len(self.recording.inputs)} frames: {self.record_path}")
+            self.recording = None
+            
+    def _read_keys(self):
+        keys = self.script_keys
+        if self.script is None:
+            keys.mask = mask_from_keys(pygame.key.get_pressed())
+        else:
+            keys.mask = self.script(self.frame)
+        if self.recording is not None:
+            self.recording.inputs.append(keys.mask)
+        return keys
+        
     def handle_events(self):
         events = pygame.event.get()
         keys = pygame.key.get_pressed()
@@ -1019,6 +2415,8 @@ class KoopaEngine:
         for e in events:
             if e.type == QUIT:
                 self.running = False
+            elif e.type == KEYDOWN and e.key == K_F3:
+                self.prof.toggle()
             elif e.type == KEYDOWN:
                 if self.mode == "title":
                     self._title_key(e.key)
@@ -1030,6 +2428,8 @@ class KoopaEngine:
                     self._editor_key(e.key, mods)
             elif e.type == MOUSEBUTTONDOWN and self.mode == "editor":
                 self._editor_mouse(e)
+            elif e.type == MOUSEBUTTONUP and self.mode == "editor" and e.button in (1, 3):
+                self.undo.commit(self.edit_lv)
             elif e.type == MOUSEMOTION and self.mode == "editor":
                 if e.buttons[0]:
                     self._editor_place(e.pos)
@@ -1051,9 +2451,13 @@ class KoopaEngine:
             if self.title_idx == 0:
                 state.reset()
                 self.mode = "map"
+                self._prepare_level(self.map_world, 1)
             elif self.title_idx == 1:
-                self.mode = "editor"
+                state.reset()
+                self._start_endless()
             elif self.title_idx == 2:
+                self.mode = "editor"
+            elif self.title_idx == 3:
                 self.running = False
         elif key == K_ESCAPE:
             self.running = False
@@ -1061,19 +2465,22 @@ class KoopaEngine:
     def _map_key(self, key):
         if key in (K_LEFT, K_a):
             self.map_world = max(1, self.map_world - 1)
+            self._prepare_level(self.map_world, 1)
         elif key in (K_RIGHT, K_d):
             self.map_world = min(8, self.map_world + 1)
+            self._prepare_level(self.map_world, 1)
         elif key in (K_RETURN, K_SPACE):
-            state.world = self.map_world
-            state.level = 1
-            self._load_level(generate_level(state.world, state.level))
-            self.mode = "game"
+            self._start_level(self.map_world, 1)
+            self._begin_recording()
         elif key == K_ESCAPE:
             self.mode = "title"
             
     def _game_key(self, key, mods):
-        if key == K_ESCAPE:
+        if key == K_ESCAPE and self.endless:
+            self.mode = "title"
+        elif key == K_ESCAPE:
             self.mode = "map"
+            self._prepare_level(self.map_world, 1)
         elif key == K_RETURN:
             self.paused = not self.paused
         elif key == K_TAB:
@@ -1092,6 +2499,8 @@ class KoopaEngine:
             self.show_help = not self.show_help
         elif key == K_t:
             self.edit_lv.theme = (self.edit_lv.theme % 8) + 1
+        elif key == K_e and (mods & KMOD_CTRL):
+            self._export_game(baked=bool(mods & KMOD_SHIFT))
         elif key == K_e:
             self._load_level(self.edit_lv.to_game())
             self.mode = "game"
@@ -1099,15 +2508,14 @@ class KoopaEngine:
         elif key == K_n and (mods & KMOD_CTRL):
             self.edit_lv = EditableLevel()
             self.undo = Undo()
-            self.undo.save(self.edit_lv)
         elif key == K_z and (mods & KMOD_CTRL):
             self.undo.undo(self.edit_lv)
         elif key == K_y and (mods & KMOD_CTRL):
             self.undo.redo(self.edit_lv)
         elif key == K_s and (mods & KMOD_CTRL):
             self._save_level()
-        elif key == K_e and (mods & KMOD_CTRL):
-            self._export_game()
+        elif key == K_o and (mods & KMOD_CTRL):
+            self._open_level()
         elif key in (K_1, K_2, K_3, K_4):
             self.pal_cat = key - K_1
             self.pal_idx = 0
@@ -1129,612 +2537,284 @@ class KoopaEngine:
         cat = PAL_CATS[self.pal_cat]
         item = PALETTE[cat][self.pal_idx][0]
         if cat in ("terrain", "blocks"):
-            if self.edit_lv.tiles.get((tx, ty)) != item:
+            if self.edit_lv.get_tile(tx, ty) != item:
+                self.undo.touch(self.edit_lv, (tx, ty))
                 self.edit_lv.set_tile(tx, ty, item)
-                self.undo.save(self.edit_lv)
         elif cat == "enemies":
+            self.undo.touch(self.edit_lv, (tx, ty))
             self.edit_lv.add_enemy(tx, ty, item)
-            self.undo.save(self.edit_lv)
         elif cat == "special":
+            self.undo.touch(self.edit_lv, item)
             if item == "player":
                 self.edit_lv.player_start = (tx, ty)
             elif item == "flag":
                 self.edit_lv.flag_pos = (tx, ty)
-            self.undo.save(self.edit_lv)
+            self.edit_lv.rev += 1
             
     def _editor_erase(self, pos):
         tx = int((pos[0] + self.edit_cam) // TILE)
         ty = int(pos[1] // TILE)
+        self.undo.touch(self.edit_lv, (tx, ty))
         self.edit_lv.remove_at(tx, ty)
-        self.undo.save(self.edit_lv)
         
     def _save_level(self):
         os.makedirs("levels", exist_ok=True)
         ts = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
         fn = f"levels/level_{ts}.kpl"
-        data = self.edit_lv.to_game()
-        with open(fn, "w") as f:
-            f.write(repr(data))
+        save_kpl(self.edit_lv.to_game(), fn)
+        self.level_file = fn
         print(f"Saved: {fn}")
         
-    def _export_game(self):
+    def _open_level(self):
+        """Load the next saved level into the editor, newest first"""
+        if not os.path.isdir("levels"): return
+        paths = sorted((os.path.join("levels", f) for f in os.listdir("levels") if f.endswith(".kpl")), reverse=True)
+        if not paths: return
+        fn = paths[(paths.index(self.level_file) + 1) % len(paths)] if self.level_file in paths else paths[0]
+        try:
+            data = load_kpl(fn)
+        except (OSError, ValueError, SyntaxError) as err:
+            print(f"Can't open {fn}: {err}")
+            return
+        self.edit_lv = EditableLevel.from_game(data)
+        self.undo = Undo()
+        self.edit_cam = 0
+        self.level_file = fn
+        print(f"Loaded: {fn}")
+        
+    def _export_game(self, baked=False):
         os.makedirs("games", exist_ok=True)
         ts = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        fn = f"games/koopa_game_{ts}.py"
+        fn = f"games/koopa_game_{ts}.{'pyz' if baked else 'py'}"
+        export_game(self.edit_lv.to_game(), fn, baked)
+        print(f"Exported: {fn}")
+        print(f"Run with: python3 {fn}")
+        
+    def _start_level(self, world, level, seed=None):
+        state.world = world
+        state.level = level
+        self.frame = 0
+        self._load_level(*self._level(world, level, seed))
+        self.mode = "game"
+        
+    def _start_endless(self, seed=None):
+        """Endless mode in the current world's theme; the same seed and inputs replay the same run"""
+        if seed is None:
+            seed = random.randrange(1 << 31)
+        self.frame = 0
+        tmap = StreamingTileMap(state.world, seed, [], [], self.bake_background, self.merge_colliders,
+                                self.preload.submit)
+        data = {"player_start": (3 * TILE, (STREAM_ROWS - 3) * TILE), "flag_pos": None, "seed": seed,
+                "enemies": tmap.stream(0, WIDTH + self.spawn_margin)}
+        self._load_level(data, tmap)
+        self.mode = "game"
         
-        # Read this file
-        with open(__file__, "r") as f:
-            engine = f.read()
+    def _prepare_level(self, world, level, seed=None):
+        self.preload.prepare(world, level, seed, self.bake_background, self.merge_colliders)
+        
+    def _level(self, world, level, seed=None):
+        return self.preload.get(world, level, seed, self.bake_background, self.merge_colliders)
+        
+    def _next_level(self):
+        if state.level < 4:
+            return state.world, state.level + 1
+        return min(8, state.world + 1), 1
+        
+    def _load_level(self, data, tmap=None):
+        if tmap is None:
+            tmap = TileMap(data, [], [], self.bake_background, self.merge_colliders)
+        self.tmap = tmap
+        self.endless = isinstance(tmap, StreamingTileMap)
+        self.effects = tmap.effects
+        self.items = tmap.items
+        ps = data["player_start"]
+        self.player = Player(ps[0], ps[1])
+        self.level_seed = data.get("seed")
+        self.rng_seed = level_rng_seed(data)
+        self.rng = random.Random(self.rng_seed)
+        self.spawn_table = deque(sorted(data.get("enemies", []), key=lambda e: e["x"]))
+        self.enemies = []
+        self.cam = self.prev_cam = 0
+        self._spawn_enemies()
+        state.time = 400
+        self.flag_pos = data.get("flag_pos", (100 * TILE, 5 * TILE))
+        self.complete = False
+        self.complete_t = 0
+        
+    def update(self, dt):
+        self.title_timer += dt
+        
+        if self.mode == "game" and not self.paused:
+            prof = self.prof
+            prof.skip()
+            keys = self._read_keys()
+            self.frame += 1
+            if not self.complete and not self.endless:
+                state.time -= dt
+                if state.time <= 0:
+                    self.player.die()
+            self.player.update(keys, self.tmap, self.enemies, self.items, dt)
+            prof.lap("player")
+            if self.player.dead and self.player.death_timer <= 0:
+                if state.lives <= 0:
+                    state.reset()
+                    self.mode = "title"
+                elif self.endless:
+                    # The run goes on: back on open ground at the left of the screen, enemies cleared
+                    self.player = Player(*self.tmap.respawn_point(self.cam + 2 * TILE))
+                    self.player.invincible = 2
+                    self.enemies = []
+                else:
+                    self._load_level(*self._level(state.world, state.level, self.level_seed))
+                return
+            for e in self.enemies:
+                if e.active:
+                    e.update(self.tmap, dt)
+            prof.lap("enemies")
+            for item in self.items:
+                if item.active:
+                    item.update(self.tmap, dt)
+            prof.lap("items")
+            for eff in self.effects[:]:
+                eff.update(dt)
+                if not eff.active:
+                    self.effects.remove(eff)
+            prof.lap("effects")
+            self.cam += (self.player.x - WIDTH // 3 - self.cam) * 0.1
+            self.cam = max(self.tmap.left, min(self.cam, self.tmap.width - WIDTH))
+            if self.endless:
+                self.spawn_table.extend(self.tmap.stream(self.player.x, self.cam + WIDTH + self.spawn_margin))
+                self.items[:] = [i for i in self.items if i.active and i.x >= self.tmap.left]
+                prof.lap("stream")
+            self._spawn_enemies()
+            if not self.complete and self.flag_pos and self.player.x >= self.flag_pos[0] - 20:
+                self.complete = True
+                gy = (len(self.tmap.tiles) // (self.tmap.width // TILE) + 13) * TILE
+                self.player.start_victory(gy)
+                self._prepare_level(*self._next_level())
+            if self.complete and self.player.victory and not self.player.flag_slide:
+                self.complete_t += dt
+                if self.complete_t > 4:
+                    state.world, state.level = self._next_level()
+                    self._load_level(*self._level(state.world, state.level))
+                    
+    def _spawn_enemies(self):
+        """Create enemies entering the spawn window and retire dead ones or those left behind"""
+        table = self.spawn_table
+        spawn_x = self.cam + WIDTH + self.spawn_margin
+        retire_x = self.cam - RETIRE_MARGIN
+        while table and table[0]["x"] < spawn_x:
+            e = table.popleft()
+            if e["x"] >= retire_x:
+                self.enemies.append(create_enemy(e["type"], e["x"], e["y"], self.rng))
+        self.enemies = [e for e in self.enemies if e.active and e.x + e.w >= retire_x]
+                    
+    def draw(self):
+        if self.mode == "title":
+            self._draw_title()
+        elif self.mode == "map":
+            self._draw_map()
+        elif self.mode == "game":
+            self._draw_game()
+        elif self.mode == "editor":
+            self._draw_editor()
+        if self.prof.on:
+            self._draw_profiler()
             
-        # Find the level data section and replace
-        level_code = self.edit_lv.to_code()
+    def _draw_profiler(self):
+        prof = self.prof
+        x0, y0, gw, gh = 8, HEIGHT - 178, PROFILE_FRAMES, 60
+        panel = pygame.Surface((gw + 128, 170))
+        panel.fill((0, 0, 0))
+        panel.set_alpha(190)
+        self.screen.blit(panel, (x0 - 4, y0 - 4))
         
-        # Create standalone game
-        game_code = f'''#!/usr/bin/env python3
-"""
-KOOPA ENGINE GAME
-Exported: {ts}
-Created with AC!'s Koopa Engine 1.1
-Team Flames / Samsoft / Flames Co.
-"""
-
-{level_code}
-
-# Engine code below - paste from koopa_engine.py or import it
-# To run: python3 {os.path.basename(fn)}
-
-import pygame
-import sys
-import math
-import random
-from pygame.locals import *
-
-SCALE = 2
-TILE = 16
-WIDTH = 256 * SCALE
-HEIGHT = 240 * SCALE
-FPS = 60
-
-GRAVITY = 0.4375
-GRAVITY_HOLD = 0.1875
-MAX_FALL = 4.5
-JUMP_WALK = -4.0
-JUMP_RUN = -5.0
-JUMP_HOLD_TIME = 0.25
-WALK_SPEED = 1.3
-RUN_SPEED = 2.5
-WALK_ACCEL = 0.15
-RUN_ACCEL = 0.2
-DECEL = 0.1
-SKID_DECEL = 0.25
-AIR_ACCEL = 0.1
-GOOMBA_SPEED = 0.5
-KOOPA_SPEED = 0.5
-SHELL_SPEED = 4.0
-
-PAL = [
-    (84,84,84),(0,30,116),(8,16,144),(48,0,136),(68,0,100),(92,0,48),(84,4,0),(60,24,0),
-    (32,42,0),(8,58,0),(0,64,0),(0,60,0),(0,50,60),(0,0,0),(0,0,0),(0,0,0),
-    (152,150,152),(8,76,196),(48,50,236),(92,30,228),(136,20,176),(160,20,100),(152,34,32),(120,60,0),
-    (84,90,0),(40,114,0),(8,124,0),(0,118,40),(0,102,120),(0,0,0),(0,0,0),(0,0,0),
-    (236,238,236),(76,154,236),(120,124,236),(176,98,236),(228,84,236),(236,88,180),(236,106,100),(212,136,32),
-    (160,170,0),(116,196,0),(76,208,32),(56,204,108),(56,180,204),(60,60,60),(0,0,0),(0,0,0),
-    (236,238,236),(168,204,236),(188,188,236),(212,178,236),(236,174,236),(236,174,212),(236,180,176),(228,196,144),
-    (204,210,120),(180,222,120),(168,226,144),(152,226,180),(160,214,228),(160,162,160),(0,0,0),(0,0,0)
-]
-
-THEMES = {{
-    1: {{"name": "GRASS LAND", "sky": 34, "ground": 23, "brick": 22, "pipe": 26}},
-    2: {{"name": "DESERT HILL", "sky": 39, "ground": 23, "brick": 22, "pipe": 26}},
-    3: {{"name": "OCEAN SIDE", "sky": 34, "ground": 27, "brick": 17, "pipe": 26}},
-    4: {{"name": "GIANT LAND", "sky": 24, "ground": 23, "brick": 22, "pipe": 10}},
-    5: {{"name": "SKY WORLD", "sky": 34, "ground": 32, "brick": 45, "pipe": 26}},
-    6: {{"name": "ICE WORLD", "sky": 32, "ground": 32, "brick": 45, "pipe": 27}},
-    7: {{"name": "PIPE MAZE", "sky": 13, "ground": 7, "brick": 6, "pipe": 10}},
-    8: {{"name": "DARK LAND", "sky": 13, "ground": 0, "brick": 6, "pipe": 0}},
-}}
-
-class GameState:
-    def __init__(self):
-        self.score = 0
-        self.coins = 0
-        self.lives = 3
-        self.time = 400
-        self.powerup = 0
-    def add_coin(self):
-        self.coins += 1
-        self.score += 200
-        if self.coins >= 100:
-            self.coins = 0
-            self.lives += 1
-
-state = GameState()
-
-class Entity:
-    def __init__(self, x, y):
-        self.x, self.y = float(x), float(y)
-        self.vx, self.vy = 0.0, 0.0
-        self.w, self.h = TILE, TILE
-        self.on_ground = False
-        self.active = True
-    def rect(self):
-        return pygame.Rect(int(self.x), int(self.y), self.w, self.h)
-    def collides(self, other):
-        return self.rect().colliderect(other.rect())
-
-class Player(Entity):
-    def __init__(self, x, y):
-        super().__init__(x, y)
-        self.w = 12
-        self.dead = False
-        self.death_timer = 0
-        self.invincible = 0
-        self.victory = False
-        self.jump_held = False
-        self.jump_timer = 0
-        self.coyote = 0
-        self.anim = 0
-        self.h = 16 if state.powerup == 0 else 32
+        # Frame-time graph, 33 ms full scale, line at the 60 Hz budget
+        gy = y0 + gh
+        for i, ms in enumerate(prof.frame_ms):
+            h = min(gh, int(ms * gh / 33.3))
+            color = PAL[42] if ms <= 1000 / FPS else PAL[22]
+            pygame.draw.line(self.screen, color, (x0 + i, gy), (x0 + i, gy - h))
+        budget_y = gy - int(gh * (1000 / FPS) / 33.3)
+        pygame.draw.line(self.screen, PAL[39], (x0, budget_y), (x0 + gw, budget_y))
         
-    def update(self, keys, tmap, enemies, items, dt):
-        if self.dead:
-            self.death_timer -= dt
-            self.vy += GRAVITY * dt * 60
-            self.y += self.vy * dt * 60
-            return
-        if self.victory:
-            self.x += 1.5 * dt * 60
-            return
-        left = keys[K_LEFT] or keys[K_a]
-        right = keys[K_RIGHT] or keys[K_d]
-        jump = keys[K_SPACE] or keys[K_z]
-        run = keys[K_LSHIFT] or keys[K_x]
-        max_spd = RUN_SPEED if run else WALK_SPEED
-        accel = RUN_ACCEL if run else WALK_ACCEL
-        if left: self.vx -= accel * dt * 60
-        elif right: self.vx += accel * dt * 60
-        else:
-            if self.vx > 0: self.vx = max(0, self.vx - DECEL * dt * 60)
-            elif self.vx < 0: self.vx = min(0, self.vx + DECEL * dt * 60)
-        self.vx = max(-max_spd, min(max_spd, self.vx))
-        if self.on_ground: self.coyote = 0.1
-        else: self.coyote -= dt
-        if jump:
-            if (self.on_ground or self.coyote > 0) and not self.jump_held:
-                self.vy = JUMP_RUN if abs(self.vx) > WALK_SPEED else JUMP_WALK
-                self.on_ground = False
-                self.coyote = 0
-                self.jump_held = True
-                self.jump_timer = JUMP_HOLD_TIME
-            elif self.jump_timer > 0 and self.vy < 0:
-                self.jump_timer -= dt
-        else:
-            self.jump_held = False
-            self.jump_timer = 0
-        grav = GRAVITY_HOLD if (self.vy < 0 and jump and self.jump_timer > 0) else GRAVITY
-        self.vy = min(self.vy + grav * dt * 60, MAX_FALL)
-        self.x += self.vx * dt * 60
-        for r in tmap.colliders:
-            if self.rect().colliderect(r):
-                if self.vx > 0: self.x = r.left - self.w
-                elif self.vx < 0: self.x = r.right
-        if self.x < 0: self.x = 0
-        self.y += self.vy * dt * 60
-        self.on_ground = False
-        for r in tmap.colliders:
-            if self.rect().colliderect(r):
-                if self.vy > 0:
-                    self.y = r.top - self.h
-                    self.vy = 0
-                    self.on_ground = True
-                elif self.vy < 0:
-                    self.y = r.bottom
-                    self.vy = 0
-                    tmap.hit_block(r.x, r.y)
-        if self.invincible > 0: self.invincible -= dt
-        for e in enemies:
-            if e.active and self.collides(e):
-                if self.vy > 0 and self.y + self.h - 8 < e.y + 8:
-                    e.stomp()
-                    self.vy = JUMP_WALK * 0.6
-                    state.score += 100
-                elif self.invincible <= 0:
-                    if state.powerup > 0:
-                        state.powerup -= 1
-                        self.h = 16
-                        self.invincible = 2
-                    else:
-                        self.dead = True
-                        self.death_timer = 3
-                        self.vy = JUMP_WALK
-                        state.lives -= 1
-        for item in items:
-            if item.active and item.emerged and self.collides(item):
-                item.active = False
-                if state.powerup < 1:
-                    state.powerup = 1
-                    self.h = 32
-                state.score += 1000
-        if self.y > tmap.height + 32:
-            self.dead = True
-            self.death_timer = 3
-            self.vy = JUMP_WALK
-            state.lives -= 1
+        # Text refreshed twice a second so the label cache isn't churned every frame
+        if not self.prof_lines or int(self.title_timer * 2) != self.prof_lines[0]:
+            p50, p95, p99 = prof.percentiles()
+            lines = [f"frame p50 {p50:.2f}  p95 {p95:.2f}  p99 {p99:.2f} ms"]
+            for p in PROFILE_PHASES:
+                h = prof.hist[p]
+                lines.append(f"{p:<9}{sum(h) / len(h) if h else 0.0:6.2f} ms")
+            self.prof_lines = [int(self.title_timer * 2)] + lines
+        font = get_font("arial", 12)
+        self.screen.blit(render_text(font, self.prof_lines[1], PAL[32]), (x0, gy + 4))
+        for i, line in enumerate(self.prof_lines[2:]):
+            col, row = divmod(i, 5)
+            self.screen.blit(render_text(font, line, PAL[32]), (x0 + col * 120, gy + 20 + row * 16))
+        self.screen.blit(render_text(font, "F3", PAL[45]), (x0 + gw + 8, y0))
             
-    def draw(self, surf, cam):
-        if self.invincible > 0 and int(self.invincible * 10) % 2 == 0: return
-        x, y = int(self.x - cam), int(self.y)
-        pygame.draw.rect(surf, PAL[22], (x+2, y, 8, 5))
-        pygame.draw.rect(surf, PAL[54], (x+2, y+5, 8, 5))
-        pygame.draw.rect(surf, PAL[22], (x+1, y+10, 10, self.h - 10))
-
-class Goomba(Entity):
-    def __init__(self, x, y):
-        super().__init__(x, y)
-        self.vx = -GOOMBA_SPEED
-        self.squished = False
-        self.squish_t = 0
-    def update(self, tmap, dt):
-        if not self.active: return
-        if self.squished:
-            self.squish_t -= dt
-            if self.squish_t <= 0: self.active = False
-            return
-        self.vy = min(self.vy + GRAVITY * dt * 60, MAX_FALL)
-        self.x += self.vx * dt * 60
-        for r in tmap.colliders:
-            if self.rect().colliderect(r): self.vx *= -1
-        self.y += self.vy * dt * 60
-        for r in tmap.colliders:
-            if self.rect().colliderect(r) and self.vy > 0:
-                self.y = r.top - self.h
-                self.vy = 0
-    def stomp(self):
-        self.squished = True
-        self.squish_t = 0.5
-        self.h = 8
-        self.y += 8
-    def draw(self, surf, cam):
-        if not self.active: return
-        x, y = int(self.x - cam), int(self.y)
-        pygame.draw.ellipse(surf, PAL[23], (x+1, y+2 if not self.squished else y, 14, 8 if self.squished else 12))
-
-class Koopa(Entity):
-    def __init__(self, x, y):
-        super().__init__(x, y)
-        self.vx = -KOOPA_SPEED
-        self.shell = False
-        self.shell_moving = False
-    def update(self, tmap, dt):
-        if not self.active: return
-        self.vy = min(self.vy + GRAVITY * dt * 60, MAX_FALL)
-        if self.shell_moving or not self.shell:
-            self.x += self.vx * dt * 60
-        for r in tmap.colliders:
-            if self.rect().colliderect(r): self.vx *= -1
-        self.y += self.vy * dt * 60
-        for r in tmap.colliders:
-            if self.rect().colliderect(r) and self.vy > 0:
-                self.y = r.top - self.h
-                self.vy = 0
-    def stomp(self):
-        if self.shell:
-            self.shell_moving = True
-            self.vx = SHELL_SPEED
-        else:
-            self.shell = True
-            self.vx = 0
-            self.h = 14
-            self.y += 8
-    def draw(self, surf, cam):
-        if not self.active: return
-        x, y = int(self.x - cam), int(self.y)
-        pygame.draw.ellipse(surf, PAL[26], (x+2, y+4, 12, 12))
-
-class Mushroom(Entity):
-    def __init__(self, x, y):
-        super().__init__(x, y)
-        self.vx = 1.0
-        self.emerge_t = 1.0
-        self.start_y = y
-        self.emerged = False
-    def update(self, tmap, dt):
-        if not self.active: return
-        if self.emerge_t > 0:
-            self.emerge_t -= dt
-            self.y = self.start_y - (1 - self.emerge_t) * TILE
-            return
-        self.emerged = True
-        self.vy = min(self.vy + GRAVITY * dt * 60, MAX_FALL)
-        self.x += self.vx * dt * 60
-        for r in tmap.colliders:
-            if self.rect().colliderect(r): self.vx *= -1
-        self.y += self.vy * dt * 60
-        for r in tmap.colliders:
-            if self.rect().colliderect(r) and self.vy > 0:
-                self.y = r.top - self.h
-                self.vy = 0
-    def draw(self, surf, cam):
-        if not self.active: return
-        x, y = int(self.x - cam), int(self.y)
-        pygame.draw.ellipse(surf, PAL[22], (x, y, 16, 12))
-
-class CoinEffect:
-    def __init__(self, x, y):
-        self.x, self.y, self.vy = x, y, -8
-        self.life = 0.4
-        self.active = True
-    def update(self, dt):
-        self.y += self.vy * dt * 60
-        self.vy += 0.5 * dt * 60
-        self.life -= dt
-        if self.life <= 0: self.active = False
-    def draw(self, surf, cam):
-        pygame.draw.ellipse(surf, PAL[39], (int(self.x - cam), int(self.y), 12, 14))
-
-class TileMap:
-    def __init__(self, data, effects, items):
-        self.effects, self.items = effects, items
-        self.tiles, self.colliders = [], []
-        self.qblocks, self.bricks = {{}}, set()
-        self.theme = THEMES.get(data.get("theme", 1), THEMES[1])
-        tiles = data["tiles"]
-        self.width = data.get("width", len(tiles[0]) * TILE)
-        self.height = len(tiles) * TILE
-        bc = data.get("block_contents", {{}})
-        for y, row in enumerate(tiles):
-            for x, c in enumerate(row):
-                if c == " ": continue
-                px, py = x * TILE, y * TILE
-                self.tiles.append((px, py, c))
-                if c in "GDBPT?":
-                    self.colliders.append(pygame.Rect(px, py, TILE, TILE))
-                if c == "?":
-                    self.qblocks[(px, py)] = {{"hit": False, "contents": bc.get(f"{{x}},{{y}}", "coin")}}
-                elif c == "B":
-                    self.bricks.add((px, py))
-    def hit_block(self, bx, by):
-        if (bx, by) in self.qblocks:
-            b = self.qblocks[(bx, by)]
-            if not b["hit"]:
-                b["hit"] = True
-                if b["contents"] == "coin":
-                    state.add_coin()
-                    self.effects.append(CoinEffect(bx + 4, by - TILE))
-                elif b["contents"] == "mushroom":
-                    self.items.append(Mushroom(bx, by - TILE))
-        if (bx, by) in self.bricks and state.powerup > 0:
-            self.bricks.discard((bx, by))
-            self.tiles = [(tx, ty, c) for tx, ty, c in self.tiles if not (tx == bx and ty == by)]
-            self.colliders = [r for r in self.colliders if not (r.x == bx and r.y == by)]
-    def draw(self, surf, cam):
-        surf.fill(PAL[self.theme["sky"]])
-        for tx, ty, c in self.tiles:
-            dx = tx - cam
-            if dx < -TILE or dx > WIDTH + TILE: continue
-            if c == "G":
-                pygame.draw.rect(surf, PAL[self.theme["ground"]], (dx, ty, TILE, TILE))
-                pygame.draw.rect(surf, PAL[26], (dx, ty, TILE, 4))
-            elif c == "D":
-                pygame.draw.rect(surf, PAL[max(0, self.theme["ground"]-1)], (dx, ty, TILE, TILE))
-            elif c == "B":
-                if (tx, ty) in self.bricks:
-                    pygame.draw.rect(surf, PAL[self.theme["brick"]], (dx, ty, TILE, TILE))
-            elif c == "?":
-                if (tx, ty) in self.qblocks and self.qblocks[(tx, ty)]["hit"]:
-                    pygame.draw.rect(surf, PAL[23], (dx, ty, TILE, TILE))
-                else:
-                    pygame.draw.rect(surf, PAL[39], (dx, ty, TILE, TILE))
-            elif c == "P":
-                pygame.draw.rect(surf, PAL[self.theme["ground"]], (dx, ty, TILE, TILE))
-            elif c == "T":
-                pygame.draw.rect(surf, PAL[self.theme["pipe"]], (dx, ty, TILE, TILE))
-
-def create_enemy(etype, x, y):
-    if etype == "koopa": return Koopa(x, y)
-    return Goomba(x, y)
-
-def main():
-    pygame.init()
-    screen = pygame.display.set_mode((WIDTH, HEIGHT))
-    pygame.display.set_caption("KOOPA ENGINE GAME")
-    clock = pygame.time.Clock()
-    effects, items = [], []
-    tmap = TileMap(LEVEL_DATA, effects, items)
-    ps = LEVEL_DATA["player_start"]
-    player = Player(ps[0], ps[1])
-    enemies = [create_enemy(e["type"], e["x"], e["y"]) for e in LEVEL_DATA.get("enemies", [])]
-    flag_pos = LEVEL_DATA.get("flag_pos", (100 * TILE, 5 * TILE))
-    cam = 0
-    running = True
-    while running:
-        dt = clock.tick(FPS) / 1000.0
-        for e in pygame.event.get():
-            if e.type == QUIT: running = False
-            elif e.type == KEYDOWN and e.key == K_ESCAPE: running = False
-        keys = pygame.key.get_pressed()
-        state.time -= dt
-        if state.time <= 0 and not player.dead:
-            player.dead = True
-            player.death_timer = 3
-            player.vy = JUMP_WALK
-            state.lives -= 1
-        player.update(keys, tmap, enemies, items, dt)
-        if player.dead and player.death_timer <= 0:
-            if state.lives <= 0: running = False
-            else:
-                state.time = 400
-                player = Player(ps[0], ps[1])
-                enemies = [create_enemy(e["type"], e["x"], e["y"]) for e in LEVEL_DATA.get("enemies", [])]
-        for e in enemies:
-            if e.active: e.update(tmap, dt)
-        for item in items:
-            if item.active: item.update(tmap, dt)
-        for eff in effects[:]:
-            eff.update(dt)
-            if not eff.active: effects.remove(eff)
-        cam += (player.x - WIDTH // 3 - cam) * 0.1
-        cam = max(0, min(cam, tmap.width - WIDTH))
-        if not player.victory and player.x >= flag_pos[0] - 20:
-            player.victory = True
-            state.score += int(state.time) * 50
-        tmap.draw(screen, cam)
-        fx = flag_pos[0] - cam
-        fy = flag_pos[1]
-        pygame.draw.rect(screen, PAL[0], (fx + 6, fy, 4, TILE * 9))
-        pygame.draw.polygon(screen, PAL[22], [(fx + 10, fy + 4), (fx + 34, fy + 16), (fx + 10, fy + 28)])
-        for e in enemies: e.draw(screen, cam)
-        for item in items: item.draw(screen, cam)
-        for eff in effects: eff.draw(screen, cam)
-        player.draw(screen, cam)
-        font = pygame.font.SysFont(None, 24)
-        screen.blit(font.render(f"SCORE: {{state.score:06d}}", True, PAL[32]), (10, 10))
-        screen.blit(font.render(f"COINS: {{state.coins:02d}}", True, PAL[32]), (200, 10))
-        screen.blit(font.render(f"TIME: {{int(max(0, state.time)):03d}}", True, PAL[32]), (350, 10))
-        screen.blit(font.render(f"LIVES: {{state.lives}}", True, PAL[32]), (480, 10))
-        if player.victory:
-            screen.blit(font.render("LEVEL COMPLETE!", True, PAL[32]), (WIDTH//2 - 80, HEIGHT//2))
-        pygame.display.flip()
-        if player.victory and player.x > tmap.width: running = False
-    pygame.quit()
-    print(f"Final Score: {{state.score}}")
-
-if __name__ == "__main__":
-    main()
-'''
+    def _draw_title(self):
+        self.screen.fill(PAL[34])
         
-        with open(fn, "w") as f:
-            f.write(game_code)
-        print(f"Exported: {fn}")
-        print(f"Run with: python3 {fn}")
+        # Animated clouds
+        for i in range(8):
+            cx = (i * 80 + int(self.title_timer * 20)) % (WIDTH + 60) - 30
+            cy = HEIGHT - 100 + (i % 3) * 30
+            pygame.draw.ellipse(self.screen, PAL[32], (cx, cy, 50, 30))
+            
+        # Hills
+        for i in range(5):
+            hx = i * 150 - 50
+            pygame.draw.polygon(self.screen, PAL[26], [(hx, HEIGHT), (hx + 75, HEIGHT - 80), (hx + 150, HEIGHT)])
+            
+        # Logo
+        font_big = get_font("arial", 48, True)
+        font_med = get_font("arial", 24)
+        font_sm = get_font("arial", 18)
         
-    def _load_level(self, data):
-        self.effects = []
-        self.items = []
-        self.tmap = TileMap(data, self.effects, self.items)
-        ps = data["player_start"]
-        self.player = Player(ps[0], ps[1])
-        self.enemies = [create_enemy(e["type"], e["x"], e["y"]) for e in data.get("enemies", [])]
-        self.cam = 0
-        state.time = 400
-        self.flag_pos = data.get("flag_pos", (100 * TILE, 5 * TILE))
-        self.complete = False
-        self.complete_t = 0
+        # Shadow
+        title = render_text(font_big, "KOOPA ENGINE", PAL[0])
+        self.screen.blit(title, (WIDTH//2 - title.get_width()//2 + 3, 60 + 3))
+        # Title
+        title = render_text(font_big, "KOOPA ENGINE", PAL[22])
+        self.screen.blit(title, (WIDTH//2 - title.get_width()//2, 60))
         
-    def update(self, dt):
-        self.title_timer += dt
-        
-        if self.mode == "game" and not self.paused:
-            keys = pygame.key.get_pressed()
-            if not self.complete:
-                state.time -= dt
-                if state.time <= 0:
-                    self.player.die()
-            self.player.update(keys, self.tmap, self.enemies, self.items, dt)
-            if self.player.dead and self.player.death_timer <= 0:
-                if state.lives <= 0:
-                    state.reset()
-                    self.mode = "title"
-                else:
-                    self._load_level(generate_level(state.world, state.level))
-                return
-            for e in self.enemies:
-                if e.active:
-                    e.update(self.tmap, dt)
-            for item in self.items:
-                if item.active:
-                    item.update(self.tmap, dt)
-            for eff in self.effects[:]:
-                eff.update(dt)
-                if not eff.active:
-                    self.effects.remove(eff)
-            self.cam += (self.player.x - WIDTH // 3 - self.cam) * 0.1
-            self.cam = max(0, min(self.cam, self.tmap.width - WIDTH))
-            if not self.complete and self.player.x >= self.flag_pos[0] - 20:
-                self.complete = True
-                gy = (len(self.tmap.tiles) // (self.tmap.width // TILE) + 13) * TILE
-                self.player.start_victory(gy)
-            if self.complete and self.player.victory and not self.player.flag_slide:
-                self.complete_t += dt
-                if self.complete_t > 4:
-                    state.level += 1
-                    if state.level > 4:
-                        state.level = 1
-                        state.world = min(8, state.world + 1)
-                    self._load_level(generate_level(state.world, state.level))
-                    
-    def draw(self):
-        if self.mode == "title":
-            self._draw_title()
-        elif self.mode == "map":
-            self._draw_map()
-        elif self.mode == "game":
-            self._draw_game()
-        elif self.mode == "editor":
-            self._draw_editor()
-            
-    def _draw_title(self):
-        self.screen.fill(PAL[34])
-        
-        # Animated clouds
-        for i in range(8):
-            cx = (i * 80 + int(self.title_timer * 20)) % (WIDTH + 60) - 30
-            cy = HEIGHT - 100 + (i % 3) * 30
-            pygame.draw.ellipse(self.screen, PAL[32], (cx, cy, 50, 30))
-            
-        # Hills
-        for i in range(5):
-            hx = i * 150 - 50
-            pygame.draw.polygon(self.screen, PAL[26], [(hx, HEIGHT), (hx + 75, HEIGHT - 80), (hx + 150, HEIGHT)])
-            
-        # Logo
-        font_big = pygame.font.SysFont("arial", 48, bold=True)
-        font_med = pygame.font.SysFont("arial", 24)
-        font_sm = pygame.font.SysFont("arial", 18)
-        
-        # Shadow
-        title = font_big.render("KOOPA ENGINE", True, PAL[0])
-        self.screen.blit(title, (WIDTH//2 - title.get_width()//2 + 3, 60 + 3))
-        # Title
-        title = font_big.render("KOOPA ENGINE", True, PAL[22])
-        self.screen.blit(title, (WIDTH//2 - title.get_width()//2, 60))
-        
-        # Version
-        ver = font_sm.render("Version 1.1 — SMB1 Accurate + Lunar Magic Editor", True, PAL[26])
-        self.screen.blit(ver, (WIDTH//2 - ver.get_width()//2, 115))
+        # Version
+        ver = render_text(font_sm, "Version 1.1 — SMB1 Accurate + Lunar Magic Editor", PAL[26])
+        self.screen.blit(ver, (WIDTH//2 - ver.get_width()//2, 115))
         
         # Credits
-        cred = font_sm.render("Team Flames / Samsoft / Flames Co.", True, PAL[45])
+        cred = render_text(font_sm, "Team Flames / Samsoft / Flames Co.", PAL[45])
         self.screen.blit(cred, (WIDTH//2 - cred.get_width()//2, 140))
         
         # Menu
         for i, opt in enumerate(self.title_opts):
             color = PAL[39] if i == self.title_idx else PAL[45]
-            text = font_med.render(opt, True, color)
+            text = render_text(font_med, opt, color)
             y = 200 + i * 45
             self.screen.blit(text, (WIDTH//2 - text.get_width()//2, y))
             if i == self.title_idx:
                 marker = "►" if int(self.title_timer * 4) % 2 == 0 else "▸"
-                m = font_med.render(marker, True, PAL[22])
+                m = render_text(font_med, marker, PAL[22])
                 self.screen.blit(m, (WIDTH//2 - text.get_width()//2 - 30, y))
                 
         # Controls
-        ctrl = font_sm.render("Arrows: Navigate | Enter: Select", True, PAL[45])
+        ctrl = render_text(font_sm, "Arrows: Navigate | Enter: Select", PAL[45])
         self.screen.blit(ctrl, (WIDTH//2 - ctrl.get_width()//2, HEIGHT - 40))
         
     def _draw_map(self):
         theme = THEMES.get(self.map_world, THEMES[1])
         self.screen.fill(PAL[theme["sky"]])
         
-        font_big = pygame.font.SysFont("arial", 36, bold=True)
-        font_med = pygame.font.SysFont("arial", 24)
-        font_sm = pygame.font.SysFont("arial", 18)
+        font_big = get_font("arial", 36, True)
+        font_med = get_font("arial", 24)
+        font_sm = get_font("arial", 18)
         
         # World name
-        title = font_big.render(f"WORLD {self.map_world}", True, PAL[32])
+        title = render_text(font_big, f"WORLD {self.map_world}", PAL[32])
         self.screen.blit(title, (WIDTH//2 - title.get_width()//2, 40))
         
-        name = font_med.render(theme["name"], True, PAL[39])
+        name = render_text(font_med, theme["name"], PAL[39])
         self.screen.blit(name, (WIDTH//2 - name.get_width()//2, 85))
         
         # World boxes
@@ -1752,7 +2832,7 @@ if __name__ == "__main__":
             pygame.draw.rect(self.screen, color, (x, y, box_sz, box_sz))
             pygame.draw.rect(self.screen, PAL[0], (x, y, box_sz, box_sz), 2)
             
-            num = font_med.render(str(i + 1), True, PAL[32])
+            num = render_text(font_med, str(i + 1), PAL[32])
             self.screen.blit(num, (x + box_sz//2 - num.get_width()//2, y + box_sz//2 - num.get_height()//2))
             
             if i + 1 == self.map_world:
@@ -1764,41 +2844,64 @@ if __name__ == "__main__":
                 
         # Stats
         stats = f"Lives: {state.lives}   Score: {state.score:06d}   Coins: {state.coins:02d}"
-        st = font_sm.render(stats, True, PAL[32])
+        st = render_text(font_sm, stats, PAL[32])
         self.screen.blit(st, (WIDTH//2 - st.get_width()//2, HEIGHT - 70))
         
         # Instructions
-        inst = font_sm.render("← → Select | ENTER Start | ESC Back", True, PAL[45])
+        inst = render_text(font_sm, "← → Select | ENTER Start | ESC Back", PAL[45])
         self.screen.blit(inst, (WIDTH//2 - inst.get_width()//2, HEIGHT - 35))
         
     def _draw_game(self):
-        self.tmap.draw(self.screen, self.cam)
+        # Interpolate positions between the last two sim states for drawing only
+        a = self.alpha
+        cam = self.cam
+        saved = None
+        if a < 1.0:
+            cam = self.prev_cam + (cam - self.prev_cam) * a
+            saved = [(e, e.x, e.y) for e in self._movers()]
+            for e, x, y in saved:
+                e.x = e.px + (x - e.px) * a
+                e.y = e.py + (y - e.py) * a
+                
+        prof = self.prof
+        prof.skip()
+        self.tmap.draw(self.screen, cam)
+        prof.lap("tilemap")
         
         # Flag
-        fx = self.flag_pos[0] - self.cam
-        fy = self.flag_pos[1]
-        pygame.draw.rect(self.screen, PAL[0], (fx + 6, fy, 4, TILE * 9))
-        pygame.draw.circle(self.screen, PAL[26], (int(fx + 8), int(fy)), 6)
-        pygame.draw.polygon(self.screen, PAL[22], [(fx + 10, fy + 4), (fx + 34, fy + 16), (fx + 10, fy + 28)])
+        if self.flag_pos:
+            fx = self.flag_pos[0] - cam
+            fy = self.flag_pos[1]
+            pygame.draw.rect(self.screen, PAL[0], (fx + 6, fy, 4, TILE * 9))
+            pygame.draw.circle(self.screen, PAL[26], (int(fx + 8), int(fy)), 6)
+            pygame.draw.polygon(self.screen, PAL[22], [(fx + 10, fy + 4), (fx + 34, fy + 16), (fx + 10, fy + 28)])
         
         for e in self.enemies:
-            e.draw(self.screen, self.cam)
+            e.draw(self.screen, cam)
         for item in self.items:
-            item.draw(self.screen, self.cam)
+            item.draw(self.screen, cam)
         for eff in self.effects:
-            eff.draw(self.screen, self.cam)
-        self.player.draw(self.screen, self.cam)
+            eff.draw(self.screen, cam)
+        self.player.draw(self.screen, cam)
+        if saved:
+            for e, x, y in saved:
+                e.x, e.y = x, y
+        prof.lap("entities")
         
         # HUD
-        font = pygame.font.SysFont("arial", 16)
-        self.screen.blit(font.render(f"WORLD {state.world}-{state.level}", True, PAL[32]), (10, 10))
-        self.screen.blit(font.render(f"SCORE: {state.score:06d}", True, PAL[32]), (130, 10))
+        font = get_font("arial", 16)
+        world = "ENDLESS" if self.endless else f"WORLD {state.world}-{state.level}"
+        self.screen.blit(render_text(font, world, PAL[32]), (10, 10))
+        self.screen.blit(render_text(font, f"SCORE: {state.score:06d}", PAL[32]), (130, 10))
         pygame.draw.ellipse(self.screen, PAL[39], (280, 8, 10, 14))
-        self.screen.blit(font.render(f"x{state.coins:02d}", True, PAL[32]), (292, 10))
-        self.screen.blit(font.render(f"TIME: {int(max(0, state.time)):03d}", True, PAL[32]), (370, 10))
-        self.screen.blit(font.render(f"♥x{state.lives}", True, PAL[22]), (470, 10))
+        self.screen.blit(render_text(font, f"x{state.coins:02d}", PAL[32]), (292, 10))
+        if self.endless:
+            self.screen.blit(render_text(font, f"DIST: {int(self.player.x) // TILE}", PAL[32]), (370, 10))
+        else:
+            self.screen.blit(render_text(font, f"TIME: {int(max(0, state.time)):03d}", PAL[32]), (370, 10))
+        self.screen.blit(render_text(font, f"♥x{state.lives}", PAL[22]), (470, 10))
         
-        hint = font.render("TAB: Editor", True, PAL[45])
+        hint = render_text(font, "TAB: Editor", PAL[45])
         self.screen.blit(hint, (WIDTH - 90, HEIGHT - 20))
         
         if self.paused:
@@ -1806,9 +2909,10 @@ if __name__ == "__main__":
             ov.fill((0, 0, 0))
             ov.set_alpha(150)
             self.screen.blit(ov, (0, 0))
-            font_b = pygame.font.SysFont("arial", 32, bold=True)
-            t = font_b.render("PAUSED", True, PAL[32])
+            font_b = get_font("arial", 32, True)
+            t = render_text(font_b, "PAUSED", PAL[32])
             self.screen.blit(t, (WIDTH//2 - t.get_width()//2, HEIGHT//2 - 16))
+        prof.lap("hud")
             
     def _draw_editor(self):
         theme = THEMES.get(self.edit_lv.theme, THEMES[1])
@@ -1822,19 +2926,20 @@ if __name__ == "__main__":
             for y in range(0, HEIGHT - 60, TILE):
                 pygame.draw.line(self.screen, (80, 80, 80), (0, y), (WIDTH, y))
                 
-        # Tiles
-        for (tx, ty), c in self.edit_lv.tiles.items():
-            dx = tx * TILE - self.edit_cam
-            dy = ty * TILE
-            if -TILE <= dx <= WIDTH + TILE and dy < HEIGHT - 60:
-                self._draw_ed_tile(dx, dy, c, theme)
-                
-        # Enemies
-        for e in self.edit_lv.enemies:
-            ex = e["x"] * TILE - self.edit_cam
-            ey = e["y"] * TILE
-            if -TILE <= ex <= WIDTH + TILE:
-                self._draw_ed_enemy(ex, ey, e["type"])
+        # Tiles and enemies in the visible columns only
+        lv = self.edit_lv
+        x0 = max(0, self.edit_cam // TILE - 1)
+        x1 = min(lv.w, (self.edit_cam + WIDTH) // TILE + 2)
+        for ty in range(min(lv.h, (HEIGHT - 60 + TILE - 1) // TILE)):
+            row = lv.grid[ty * lv.w + x0:ty * lv.w + x1]
+            for i, c in enumerate(row):
+                if c != 32:
+                    self._draw_ed_tile((x0 + i) * TILE - self.edit_cam, ty * TILE, chr(c), theme)
+        for tx in range(x0, x1):
+            for ty in range(lv.h):
+                etype = lv.enemy_at.get((tx, ty))
+                if etype is not None:
+                    self._draw_ed_enemy(tx * TILE - self.edit_cam, ty * TILE, etype)
                 
         # Player start
         px = self.edit_lv.player_start[0] * TILE - self.edit_cam
@@ -1848,148 +2953,1301 @@ if __name__ == "__main__":
         pygame.draw.rect(self.screen, PAL[0], (fx + 6, fy, 4, 32))
         pygame.draw.polygon(self.screen, PAL[22], [(fx + 10, fy + 4), (fx + 26, fy + 12), (fx + 10, fy + 20)])
         
+        # Live solvability check, rerun on the preload worker when the level changed and no stroke
+        # is being painted; the previous result stays up until the new one is in
+        lv = self.edit_lv
+        check = self.edit_check
+        if check is not None and check[2].done():
+            self.edit_reach = (check[0], check[1], check[2].result())
+            check = self.edit_check = None
+        if check is None and self.undo.stroke is None and (self.edit_reach is None or self.edit_reach[:2] != (lv, lv.rev)):
+            self.edit_check = (lv, lv.rev, self.preload.submit(analyze_level, lv.to_game()))
+        reach = self.edit_reach[2] if self.edit_reach is not None and self.edit_reach[0] is lv else None
+        if reach is None:
+            msg, color = "Checking...", PAL[32]
+        elif reach["solvable"]:
+            msg, color = f"Finishable ({reach['ms']:.1f} ms)", PAL[42]
+        else:
+            msg, color = f"Not finishable: stuck at column {reach['furthest']} ({reach['ms']:.1f} ms)", PAL[22]
+            sx = (reach["furthest"] + 1) * TILE - self.edit_cam
+            pygame.draw.line(self.screen, PAL[22], (sx, 0), (sx, HEIGHT - 60), 2)
+        self.screen.blit(render_text(get_font("arial", 14), msg, color), (8, 6))
+        
         # Palette bar
         self._draw_palette()
         
-        # Help
-        if self.show_help:
-            self._draw_help()
-            
-    def _draw_ed_tile(self, dx, dy, c, t):
-        if c == "G":
-            pygame.draw.rect(self.screen, PAL[t["ground"]], (dx, dy, TILE, TILE))
-            pygame.draw.rect(self.screen, PAL[26], (dx, dy, TILE, 4))
-        elif c == "D":
-            pygame.draw.rect(self.screen, PAL[max(0, t["ground"]-1)], (dx, dy, TILE, TILE))
-        elif c == "B":
-            pygame.draw.rect(self.screen, PAL[t["brick"]], (dx, dy, TILE, TILE))
-            pygame.draw.rect(self.screen, PAL[0], (dx, dy+7, TILE, 2))
-            pygame.draw.rect(self.screen, PAL[0], (dx+7, dy, 2, TILE))
-        elif c == "?":
-            pygame.draw.rect(self.screen, PAL[39], (dx, dy, TILE, TILE))
-            pygame.draw.rect(self.screen, PAL[40], (dx+4, dy+4, 8, 8))
-        elif c == "P":
-            pygame.draw.rect(self.screen, PAL[t["ground"]], (dx, dy, TILE, TILE))
-            pygame.draw.rect(self.screen, PAL[0], (dx+2, dy+2, 12, 12))
-        elif c == "T":
-            pygame.draw.rect(self.screen, PAL[t["pipe"]], (dx, dy, TILE, TILE))
-            pygame.draw.rect(self.screen, PAL[26], (dx+2, dy, 4, TILE))
-            
-    def _draw_ed_enemy(self, ex, ey, etype):
-        if etype == "goomba":
-            pygame.draw.ellipse(self.screen, GOOMBA, (ex+1, ey+2, 14, 12))
-        elif etype == "koopa":
-            pygame.draw.ellipse(self.screen, KOOPA_G, (ex+2, ey+4, 12, 12))
-            pygame.draw.ellipse(self.screen, PAL[40], (ex+4, ey, 8, 8))
-        elif etype == "piranha":
-            pygame.draw.ellipse(self.screen, PAL[22], (ex, ey+4, 16, 12))
+        # Help
+        if self.show_help:
+            self._draw_help()
+            
+    def _draw_ed_tile(self, dx, dy, c, t):
+        if c == "G":
+            pygame.draw.rect(self.screen, PAL[t["ground"]], (dx, dy, TILE, TILE))
+            pygame.draw.rect(self.screen, PAL[26], (dx, dy, TILE, 4))
+        elif c == "D":
+            pygame.draw.rect(self.screen, PAL[max(0, t["ground"]-1)], (dx, dy, TILE, TILE))
+        elif c == "B":
+            pygame.draw.rect(self.screen, PAL[t["brick"]], (dx, dy, TILE, TILE))
+            pygame.draw.rect(self.screen, PAL[0], (dx, dy+7, TILE, 2))
+            pygame.draw.rect(self.screen, PAL[0], (dx+7, dy, 2, TILE))
+        elif c == "?":
+            pygame.draw.rect(self.screen, PAL[39], (dx, dy, TILE, TILE))
+            pygame.draw.rect(self.screen, PAL[40], (dx+4, dy+4, 8, 8))
+        elif c == "P":
+            pygame.draw.rect(self.screen, PAL[t["ground"]], (dx, dy, TILE, TILE))
+            pygame.draw.rect(self.screen, PAL[0], (dx+2, dy+2, 12, 12))
+        elif c == "T":
+            pygame.draw.rect(self.screen, PAL[t["pipe"]], (dx, dy, TILE, TILE))
+            pygame.draw.rect(self.screen, PAL[26], (dx+2, dy, 4, TILE))
+            
+    def _draw_ed_enemy(self, ex, ey, etype):
+        if etype == "goomba":
+            pygame.draw.ellipse(self.screen, GOOMBA, (ex+1, ey+2, 14, 12))
+        elif etype == "koopa":
+            pygame.draw.ellipse(self.screen, KOOPA_G, (ex+2, ey+4, 12, 12))
+            pygame.draw.ellipse(self.screen, PAL[40], (ex+4, ey, 8, 8))
+        elif etype == "piranha":
+            pygame.draw.ellipse(self.screen, PAL[22], (ex, ey+4, 16, 12))
+            
+    def _draw_palette(self):
+        pygame.draw.rect(self.screen, PAL[0], (0, HEIGHT - 60, WIDTH, 60))
+        
+        font = get_font("arial", 14)
+        cat = PAL_CATS[self.pal_cat]
+        
+        # Category tabs
+        for i, c in enumerate(PAL_CATS):
+            color = PAL[32] if i == self.pal_cat else PAL[45]
+            text = render_text(font, c.upper(), color)
+            self.screen.blit(text, (10 + i * 100, HEIGHT - 58))
+            
+        # Items
+        items = PALETTE[cat]
+        for i, (item_id, name) in enumerate(items):
+            x = 10 + i * 55
+            y = HEIGHT - 38
+            if i == self.pal_idx:
+                pygame.draw.rect(self.screen, PAL[32], (x - 2, y - 2, 24, 24), 2)
+            self._draw_pal_item(x, y, item_id, cat)
+            
+        # Name
+        if items:
+            n = items[self.pal_idx][1]
+            nt = render_text(font, n, PAL[32])
+            self.screen.blit(nt, (WIDTH - 130, HEIGHT - 30))
+            
+        # Theme indicator
+        ti = render_text(font, f"Theme: {self.edit_lv.theme}", PAL[45])
+        self.screen.blit(ti, (WIDTH - 130, HEIGHT - 50))
+        
+    def _draw_pal_item(self, x, y, item_id, cat):
+        if cat == "terrain":
+            if item_id == "G":
+                pygame.draw.rect(self.screen, PAL[23], (x, y, 20, 20))
+                pygame.draw.rect(self.screen, PAL[26], (x, y, 20, 4))
+            elif item_id == "D":
+                pygame.draw.rect(self.screen, PAL[22], (x, y, 20, 20))
+            elif item_id == "P":
+                pygame.draw.rect(self.screen, PAL[23], (x, y, 20, 20))
+                pygame.draw.rect(self.screen, PAL[0], (x+2, y+2, 16, 16))
+            elif item_id == "T":
+                pygame.draw.rect(self.screen, PAL[26], (x, y, 20, 20))
+            elif item_id == " ":
+                pygame.draw.rect(self.screen, PAL[32], (x, y, 20, 20), 1)
+                pygame.draw.line(self.screen, PAL[22], (x, y), (x+20, y+20))
+        elif cat == "blocks":
+            if item_id == "B":
+                pygame.draw.rect(self.screen, PAL[22], (x, y, 20, 20))
+                pygame.draw.rect(self.screen, PAL[0], (x, y+9, 20, 2))
+                pygame.draw.rect(self.screen, PAL[0], (x+9, y, 2, 20))
+            elif item_id in ("?", "?C", "?M"):
+                pygame.draw.rect(self.screen, PAL[39], (x, y, 20, 20))
+                pygame.draw.rect(self.screen, PAL[40], (x+4, y+4, 12, 12))
+        elif cat == "enemies":
+            if item_id == "goomba":
+                pygame.draw.ellipse(self.screen, GOOMBA, (x+2, y+4, 16, 14))
+            elif item_id == "koopa":
+                pygame.draw.ellipse(self.screen, KOOPA_G, (x+2, y+4, 16, 14))
+            elif item_id == "piranha":
+                pygame.draw.ellipse(self.screen, PAL[22], (x+2, y+6, 16, 12))
+        elif cat == "special":
+            if item_id == "player":
+                pygame.draw.rect(self.screen, PAL[22], (x+4, y+2, 12, 16))
+            elif item_id == "flag":
+                pygame.draw.rect(self.screen, PAL[0], (x+8, y+2, 3, 18))
+                pygame.draw.polygon(self.screen, PAL[22], [(x+11, y+4), (x+20, y+8), (x+11, y+12)])
+                
+    def _draw_help(self):
+        ov = pygame.Surface((WIDTH, HEIGHT))
+        ov.fill((0, 0, 0))
+        ov.set_alpha(220)
+        self.screen.blit(ov, (0, 0))
+        
+        font = get_font("arial", 16)
+        lines = [
+            "═══ KOOPA ENGINE EDITOR ═══",
+            "",
+            "Left Click: Place tile/enemy",
+            "Right Click: Erase",
+            "Mouse Wheel: Scroll palette",
+            "1-4: Switch categories",
+            "WASD/Arrows: Pan camera",
+            "",
+            "E / TAB: Play test level",
+            "G: Toggle grid",
+            "T: Change theme (1-8)",
+            "H: Toggle this help",
+            "",
+            "Ctrl+S: Save level (.kpl)",
+            "Ctrl+O: Open saved level (.kpl)",
+            "Ctrl+E: Export game (.py) | +Shift: baked (.pyz)",
+            "Ctrl+Z: Undo | Ctrl+Y: Redo",
+            "Ctrl+N: New level",
+            "",
+            "ESC: Back to title"
+        ]
+        
+        for i, line in enumerate(lines):
+            color = PAL[39] if i == 0 else PAL[32]
+            t = render_text(font, line, color)
+            self.screen.blit(t, (WIDTH//2 - t.get_width()//2, 25 + i * 22))
+
+# ╔═══════════════════════════════════════════════════════════════════════════════╗
+# ║ STANDALONE EXPORT                                                             ║
+# ╚═══════════════════════════════════════════════════════════════════════════════╝
+BAKE_HEADER = struct.Struct("<HHIBiiiiIIII")    # cols, rows, width, theme, start, flag, rect/enemy/block counts, PNG size
+BAKE_RECT = struct.Struct("<iiHH")
+
+def level_code(data):
+    """LEVEL_DATA source for a plain export"""
+    rows = [row.decode() for row in level_rows(data["tiles"])]
+    return f'''LEVEL_DATA = {{
+    "tiles": {rows!r},
+    "enemies": {data["enemies"]!r},
+    "player_start": {data["player_start"]!r},
+    "flag_pos": {data["flag_pos"]!r},
+    "width": {data["width"]},
+    "block_contents": {data["block_contents"]!r},
+    "theme": {data["theme"]}
+}}'''
+
+def bake_level(data):
+    """zlib blob for a baked export: header, tile grid, collision rects (merged, except ? blocks and
+    bricks, which stay one tile so they can be hit), spawn table, ? block contents and the theme's
+    tile atlas as a PNG"""
+    rows = level_rows(data["tiles"])
+    h, w = len(rows), len(rows[0])
+    grid = b"".join(rows)
+    theme = data.get("theme", 1)
+    tmap = TileMap(data, [], [])
+    fixed = [(x, y) for x, y in tmap.cells if grid[y * w + x] not in b"?B"]
+    rects = merge_solids(fixed) + [r for (x, y), r in tmap.cells.items() if grid[y * w + x] in b"?B"]
+    enemies = sorted(data.get("enemies", []), key=lambda e: e["x"])
+    blocks = [(px // TILE, py // TILE, KPL_CONTENTS.index(b["contents"])) for (px, py), b in tmap.qblocks.items()]
+    strip = pygame.Surface((len(TILE_KINDS) * TILE, TILE))
+    for i, kind in enumerate(TILE_KINDS):
+        paint_tile(strip, i * TILE, 0, kind, THEMES.get(theme, THEMES[1]))
+    png = io.BytesIO()
+    pygame.image.save(strip, png, "atlas.png")
+    png = png.getvalue()
+    out = bytearray(BAKE_HEADER.pack(w, h, data.get("width", w * TILE), theme,
+                                     int(data["player_start"][0]), int(data["player_start"][1]),
+                                     int(data["flag_pos"][0]), int(data["flag_pos"][1]),
+                                     len(rects), len(enemies), len(blocks), len(png)))
+    out += grid
+    for r in rects:
+        out += BAKE_RECT.pack(r.x, r.y, r.w, r.h)
+    for e in enemies:
+        out += KPL_ENEMY.pack(int(e["x"]), int(e["y"]), KPL_ENEMY_TYPES.index(e["type"]))
+    for b in blocks:
+        out += KPL_CONTENT.pack(*b)
+    out += png
+    return zlib.compress(bytes(out), 9)
+
+def export_game(data, path, baked=False):
+    """Write a standalone game for level data: a .py carrying LEVEL_DATA, or with baked=True a
+    zipapp whose precompiled __main__ (for this Python version) embeds bake_level()'s blob, so
+    nothing is parsed or rebuilt tile by tile at startup. Both carry paint_tile: the .py draws each
+    tile with it, the zipapp blits the atlas it painted"""
+    ts = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    if baked:
+        level_section = f"BAKED = {bake_level(data)!r}"
+        extra_imports = "import io\nimport struct\nimport zlib\n"
+        loader = f'''BAKE_HEADER = struct.Struct({BAKE_HEADER.format!r})
+BAKE_RECT = struct.Struct({BAKE_RECT.format!r})
+BAKE_ENEMY = struct.Struct({KPL_ENEMY.format!r})
+BAKE_BLOCK = struct.Struct({KPL_CONTENT.format!r})
+ENEMY_TYPES = {KPL_ENEMY_TYPES!r}
+CONTENTS = {KPL_CONTENTS!r}
+TILE_KINDS = {TILE_KINDS!r}
+
+class BakedTileMap(TileMap):
+    def __init__(self, effects, items):
+        raw = zlib.decompress(BAKED)
+        (cols, rows, self.width, theme, sx, sy, fx, fy,
+         n_rects, n_enemies, n_blocks, n_png) = BAKE_HEADER.unpack_from(raw)
+        self.effects, self.items = effects, items
+        self.theme = THEMES.get(theme, THEMES[1])
+        self.cols, self.rows = cols, rows
+        self.height = rows * TILE
+        self.tiles = []
+        off = BAKE_HEADER.size
+        self.grid = bytearray(raw[off:off + cols * rows])
+        off += cols * rows
+        self.colliders = [pygame.Rect(r) for r in BAKE_RECT.iter_unpack(raw[off:off + n_rects * BAKE_RECT.size])]
+        off += n_rects * BAKE_RECT.size
+        enemies = [{{"x": x, "y": y, "type": ENEMY_TYPES[t]}}
+                   for x, y, t in BAKE_ENEMY.iter_unpack(raw[off:off + n_enemies * BAKE_ENEMY.size])]
+        off += n_enemies * BAKE_ENEMY.size
+        self.qblocks = {{(x * TILE, y * TILE): {{"hit": False, "contents": CONTENTS[c]}}
+                        for x, y, c in BAKE_BLOCK.iter_unpack(raw[off:off + n_blocks * BAKE_BLOCK.size])}}
+        off += n_blocks * BAKE_BLOCK.size
+        self.bricks = set()
+        i = self.grid.find(b"B")
+        while i >= 0:
+            self.bricks.add((i % cols * TILE, i // cols * TILE))
+            i = self.grid.find(b"B", i + 1)
+        atlas = pygame.image.load(io.BytesIO(raw[off:off + n_png]), "atlas.png").convert()
+        sprite = lambda i: atlas.subsurface((i * TILE, 0, TILE, TILE))
+        self.sprites = {{ord(k): sprite(i) for i, k in enumerate(TILE_KINDS) if len(k) == 1}}
+        self.hit_sprite = sprite(TILE_KINDS.index("?hit"))
+        self.level = {{"player_start": (sx, sy), "flag_pos": (fx, fy), "enemies": enemies}}
+    def hit_block(self, bx, by):
+        had = len(self.bricks)
+        super().hit_block(bx, by)
+        if len(self.bricks) < had:
+            self.grid[by // TILE * self.cols + bx // TILE] = 32
+    def draw(self, surf, cam):
+        surf.fill(PAL[self.theme["sky"]])
+        grid, cols, sprites, qblocks = self.grid, self.cols, self.sprites, self.qblocks
+        x0 = max(0, int(cam) // TILE)
+        x1 = min(cols, x0 + WIDTH // TILE + 2)
+        batch = []
+        for y in range(self.rows):
+            py = y * TILE
+            for x in range(x0, x1):
+                c = grid[y * cols + x]
+                if c == 32: continue
+                if c == 63 and qblocks[(x * TILE, py)]["hit"]:
+                    sprite = self.hit_sprite
+                else:
+                    sprite = sprites.get(c)
+                if sprite is not None:
+                    batch.append((sprite, (x * TILE - cam, py)))
+        surf.blits(batch, doreturn=False)
+
+def load_level(effects, items):
+    tmap = BakedTileMap(effects, items)
+    return tmap, tmap.level
+'''
+    else:
+        level_section = level_code(data)
+        extra_imports = ""
+        loader = '''def load_level(effects, items):
+    return TileMap(LEVEL_DATA, effects, items), LEVEL_DATA
+'''
+        
+    game_code = f'''#!/usr/bin/env python3
+"""
+KOOPA ENGINE GAME
+Exported: {ts}
+Created with AC!'s Koopa Engine 1.1
+Team Flames / Samsoft / Flames Co.
+"""
+
+{level_section}
+
+# Engine code below - paste from koopa_engine.py or import it
+# To run: python3 {os.path.basename(path)}
+
+import pygame
+import sys
+import math
+import random
+{extra_imports}from pygame.locals import *
+
+SCALE = 2
+TILE = 16
+WIDTH = 256 * SCALE
+HEIGHT = 240 * SCALE
+FPS = 60
+
+GRAVITY = 0.4375
+GRAVITY_HOLD = 0.1875
+MAX_FALL = 4.5
+JUMP_WALK = -4.0
+JUMP_RUN = -5.0
+JUMP_HOLD_TIME = 0.25
+WALK_SPEED = 1.3
+RUN_SPEED = 2.5
+WALK_ACCEL = 0.15
+RUN_ACCEL = 0.2
+DECEL = 0.1
+SKID_DECEL = 0.25
+AIR_ACCEL = 0.1
+GOOMBA_SPEED = 0.5
+KOOPA_SPEED = 0.5
+SHELL_SPEED = 4.0
+
+PAL = [
+    (84,84,84),(0,30,116),(8,16,144),(48,0,136),(68,0,100),(92,0,48),(84,4,0),(60,24,0),
+    (32,42,0),(8,58,0),(0,64,0),(0,60,0),(0,50,60),(0,0,0),(0,0,0),(0,0,0),
+    (152,150,152),(8,76,196),(48,50,236),(92,30,228),(136,20,176),(160,20,100),(152,34,32),(120,60,0),
+    (84,90,0),(40,114,0),(8,124,0),(0,118,40),(0,102,120),(0,0,0),(0,0,0),(0,0,0),
+    (236,238,236),(76,154,236),(120,124,236),(176,98,236),(228,84,236),(236,88,180),(236,106,100),(212,136,32),
+    (160,170,0),(116,196,0),(76,208,32),(56,204,108),(56,180,204),(60,60,60),(0,0,0),(0,0,0),
+    (236,238,236),(168,204,236),(188,188,236),(212,178,236),(236,174,236),(236,174,212),(236,180,176),(228,196,144),
+    (204,210,120),(180,222,120),(168,226,144),(152,226,180),(160,214,228),(160,162,160),(0,0,0),(0,0,0)
+]
+
+THEMES = {{
+    1: {{"name": "GRASS LAND", "sky": 34, "ground": 23, "brick": 22, "pipe": 26}},
+    2: {{"name": "DESERT HILL", "sky": 39, "ground": 23, "brick": 22, "pipe": 26}},
+    3: {{"name": "OCEAN SIDE", "sky": 34, "ground": 27, "brick": 17, "pipe": 26}},
+    4: {{"name": "GIANT LAND", "sky": 24, "ground": 23, "brick": 22, "pipe": 10}},
+    5: {{"name": "SKY WORLD", "sky": 34, "ground": 32, "brick": 45, "pipe": 26}},
+    6: {{"name": "ICE WORLD", "sky": 32, "ground": 32, "brick": 45, "pipe": 27}},
+    7: {{"name": "PIPE MAZE", "sky": 13, "ground": 7, "brick": 6, "pipe": 10}},
+    8: {{"name": "DARK LAND", "sky": 13, "ground": 0, "brick": 6, "pipe": 0}},
+}}
+
+class GameState:
+    def __init__(self):
+        self.score = 0
+        self.coins = 0
+        self.lives = 3
+        self.time = 400
+        self.powerup = 0
+    def add_coin(self):
+        self.coins += 1
+        self.score += 200
+        if self.coins >= 100:
+            self.coins = 0
+            self.lives += 1
+
+state = GameState()
+
+class Entity:
+    def __init__(self, x, y):
+        self.x, self.y = float(x), float(y)
+        self.vx, self.vy = 0.0, 0.0
+        self.w, self.h = TILE, TILE
+        self.on_ground = False
+        self.active = True
+    def rect(self):
+        return pygame.Rect(int(self.x), int(self.y), self.w, self.h)
+    def collides(self, other):
+        return self.rect().colliderect(other.rect())
+
+class Player(Entity):
+    def __init__(self, x, y):
+        super().__init__(x, y)
+        self.w = 12
+        self.dead = False
+        self.death_timer = 0
+        self.invincible = 0
+        self.victory = False
+        self.jump_held = False
+        self.jump_timer = 0
+        self.coyote = 0
+        self.anim = 0
+        self.h = 16 if state.powerup == 0 else 32
+        
+    def update(self, keys, tmap, enemies, items, dt):
+        if self.dead:
+            self.death_timer -= dt
+            self.vy += GRAVITY * dt * 60
+            self.y += self.vy * dt * 60
+            return
+        if self.victory:
+            self.x += 1.5 * dt * 60
+            return
+        left = keys[K_LEFT] or keys[K_a]
+        right = keys[K_RIGHT] or keys[K_d]
+        jump = keys[K_SPACE] or keys[K_z]
+        run = keys[K_LSHIFT] or keys[K_x]
+        max_spd = RUN_SPEED if run else WALK_SPEED
+        accel = RUN_ACCEL if run else WALK_ACCEL
+        if left: self.vx -= accel * dt * 60
+        elif right: self.vx += accel * dt * 60
+        else:
+            if self.vx > 0: self.vx = max(0, self.vx - DECEL * dt * 60)
+            elif self.vx < 0: self.vx = min(0, self.vx + DECEL * dt * 60)
+        self.vx = max(-max_spd, min(max_spd, self.vx))
+        if self.on_ground: self.coyote = 0.1
+        else: self.coyote -= dt
+        if jump:
+            if (self.on_ground or self.coyote > 0) and not self.jump_held:
+                self.vy = JUMP_RUN if abs(self.vx) > WALK_SPEED else JUMP_WALK
+                self.on_ground = False
+                self.coyote = 0
+                self.jump_held = True
+                self.jump_timer = JUMP_HOLD_TIME
+            elif self.jump_timer > 0 and self.vy < 0:
+                self.jump_timer -= dt
+        else:
+            self.jump_held = False
+            self.jump_timer = 0
+        grav = GRAVITY_HOLD if (self.vy < 0 and jump and self.jump_timer > 0) else GRAVITY
+        self.vy = min(self.vy + grav * dt * 60, MAX_FALL)
+        self.x += self.vx * dt * 60
+        for r in tmap.colliders:
+            if self.rect().colliderect(r):
+                if self.vx > 0: self.x = r.left - self.w
+                elif self.vx < 0: self.x = r.right
+        if self.x < 0: self.x = 0
+        self.y += self.vy * dt * 60
+        self.on_ground = False
+        for r in tmap.colliders:
+            if self.rect().colliderect(r):
+                if self.vy > 0:
+                    self.y = r.top - self.h
+                    self.vy = 0
+                    self.on_ground = True
+                elif self.vy < 0:
+                    self.y = r.bottom
+                    self.vy = 0
+                    tmap.hit_block(r.x, r.y)
+        if self.invincible > 0: self.invincible -= dt
+        for e in enemies:
+            if e.active and self.collides(e):
+                if self.vy > 0 and self.y + self.h - 8 < e.y + 8:
+                    e.stomp()
+                    self.vy = JUMP_WALK * 0.6
+                    state.score += 100
+                elif self.invincible <= 0:
+                    if state.powerup > 0:
+                        state.powerup -= 1
+                        self.h = 16
+                        self.invincible = 2
+                    else:
+                        self.dead = True
+                        self.death_timer = 3
+                        self.vy = JUMP_WALK
+                        state.lives -= 1
+        for item in items:
+            if item.active and item.emerged and self.collides(item):
+                item.active = False
+                if state.powerup < 1:
+                    state.powerup = 1
+                    self.h = 32
+                state.score += 1000
+        if self.y > tmap.height + 32:
+            self.dead = True
+            self.death_timer = 3
+            self.vy = JUMP_WALK
+            state.lives -= 1
+            
+    def draw(self, surf, cam):
+        if self.invincible > 0 and int(self.invincible * 10) % 2 == 0: return
+        x, y = int(self.x - cam), int(self.y)
+        pygame.draw.rect(surf, PAL[22], (x+2, y, 8, 5))
+        pygame.draw.rect(surf, PAL[54], (x+2, y+5, 8, 5))
+        pygame.draw.rect(surf, PAL[22], (x+1, y+10, 10, self.h - 10))
+
+class Goomba(Entity):
+    def __init__(self, x, y):
+        super().__init__(x, y)
+        self.vx = -GOOMBA_SPEED
+        self.squished = False
+        self.squish_t = 0
+    def update(self, tmap, dt):
+        if not self.active: return
+        if self.squished:
+            self.squish_t -= dt
+            if self.squish_t <= 0: self.active = False
+            return
+        self.vy = min(self.vy + GRAVITY * dt * 60, MAX_FALL)
+        self.x += self.vx * dt * 60
+        for r in tmap.colliders:
+            if self.rect().colliderect(r): self.vx *= -1
+        self.y += self.vy * dt * 60
+        for r in tmap.colliders:
+            if self.rect().colliderect(r) and self.vy > 0:
+                self.y = r.top - self.h
+                self.vy = 0
+    def stomp(self):
+        self.squished = True
+        self.squish_t = 0.5
+        self.h = 8
+        self.y += 8
+    def draw(self, surf, cam):
+        if not self.active: return
+        x, y = int(self.x - cam), int(self.y)
+        pygame.draw.ellipse(surf, PAL[23], (x+1, y+2 if not self.squished else y, 14, 8 if self.squished else 12))
+
+class Koopa(Entity):
+    def __init__(self, x, y):
+        super().__init__(x, y)
+        self.vx = -KOOPA_SPEED
+        self.shell = False
+        self.shell_moving = False
+    def update(self, tmap, dt):
+        if not self.active: return
+        self.vy = min(self.vy + GRAVITY * dt * 60, MAX_FALL)
+        if self.shell_moving or not self.shell:
+            self.x += self.vx * dt * 60
+        for r in tmap.colliders:
+            if self.rect().colliderect(r): self.vx *= -1
+        self.y += self.vy * dt * 60
+        for r in tmap.colliders:
+            if self.rect().colliderect(r) and self.vy > 0:
+                self.y = r.top - self.h
+                self.vy = 0
+    def stomp(self):
+        if self.shell:
+            self.shell_moving = True
+            self.vx = SHELL_SPEED
+        else:
+            self.shell = True
+            self.vx = 0
+            self.h = 14
+            self.y += 8
+    def draw(self, surf, cam):
+        if not self.active: return
+        x, y = int(self.x - cam), int(self.y)
+        pygame.draw.ellipse(surf, PAL[26], (x+2, y+4, 12, 12))
+
+class Mushroom(Entity):
+    def __init__(self, x, y):
+        super().__init__(x, y)
+        self.vx = 1.0
+        self.emerge_t = 1.0
+        self.start_y = y
+        self.emerged = False
+    def update(self, tmap, dt):
+        if not self.active: return
+        if self.emerge_t > 0:
+            self.emerge_t -= dt
+            self.y = self.start_y - (1 - self.emerge_t) * TILE
+            return
+        self.emerged = True
+        self.vy = min(self.vy + GRAVITY * dt * 60, MAX_FALL)
+        self.x += self.vx * dt * 60
+        for r in tmap.colliders:
+            if self.rect().colliderect(r): self.vx *= -1
+        self.y += self.vy * dt * 60
+        for r in tmap.colliders:
+            if self.rect().colliderect(r) and self.vy > 0:
+                self.y = r.top - self.h
+                self.vy = 0
+    def draw(self, surf, cam):
+        if not self.active: return
+        x, y = int(self.x - cam), int(self.y)
+        pygame.draw.ellipse(surf, PAL[22], (x, y, 16, 12))
+
+class CoinEffect:
+    def __init__(self, x, y):
+        self.x, self.y, self.vy = x, y, -8
+        self.life = 0.4
+        self.active = True
+    def update(self, dt):
+        self.y += self.vy * dt * 60
+        self.vy += 0.5 * dt * 60
+        self.life -= dt
+        if self.life <= 0: self.active = False
+    def draw(self, surf, cam):
+        pygame.draw.ellipse(surf, PAL[39], (int(self.x - cam), int(self.y), 12, 14))
+
+class TileMap:
+    def __init__(self, data, effects, items):
+        self.effects, self.items = effects, items
+        self.tiles, self.colliders = [], []
+        self.qblocks, self.bricks = {{}}, set()
+        self.theme = THEMES.get(data.get("theme", 1), THEMES[1])
+        tiles = data["tiles"]
+        self.width = data.get("width", len(tiles[0]) * TILE)
+        self.height = len(tiles) * TILE
+        bc = data.get("block_contents", {{}})
+        for y, row in enumerate(tiles):
+            for x, c in enumerate(row):
+                if c == " ": continue
+                px, py = x * TILE, y * TILE
+                self.tiles.append((px, py, c))
+                if c in "GDBPT?":
+                    self.colliders.append(pygame.Rect(px, py, TILE, TILE))
+                if c == "?":
+                    self.qblocks[(px, py)] = {{"hit": False, "contents": bc.get(f"{{x}},{{y}}", "coin")}}
+                elif c == "B":
+                    self.bricks.add((px, py))
+    def hit_block(self, bx, by):
+        if (bx, by) in self.qblocks:
+            b = self.qblocks[(bx, by)]
+            if not b["hit"]:
+                b["hit"] = True
+                if b["contents"] == "coin":
+                    state.add_coin()
+                    self.effects.append(CoinEffect(bx + 4, by - TILE))
+                elif b["contents"] == "mushroom":
+                    self.items.append(Mushroom(bx, by - TILE))
+        if (bx, by) in self.bricks and state.powerup > 0:
+            self.bricks.discard((bx, by))
+            self.tiles = [(tx, ty, c) for tx, ty, c in self.tiles if not (tx == bx and ty == by)]
+            self.colliders = [r for r in self.colliders if not (r.x == bx and r.y == by)]
+    def draw(self, surf, cam):
+        surf.fill(PAL[self.theme["sky"]])
+        for tx, ty, c in self.tiles:
+            dx = tx - cam
+            if dx < -TILE or dx > WIDTH + TILE: continue
+            if c == "?" and self.qblocks[(tx, ty)]["hit"]:
+                c = "?hit"
+            paint_tile(surf, dx, ty, c, self.theme)
+
+{inspect.getsource(paint_tile)}
+{loader}
+def create_enemy(etype, x, y):
+    if etype == "koopa": return Koopa(x, y)
+    return Goomba(x, y)
+
+def main():
+    pygame.init()
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption("KOOPA ENGINE GAME")
+    clock = pygame.time.Clock()
+    effects, items = [], []
+    tmap, level = load_level(effects, items)
+    ps = level["player_start"]
+    player = Player(ps[0], ps[1])
+    enemies = [create_enemy(e["type"], e["x"], e["y"]) for e in level.get("enemies", [])]
+    flag_pos = level.get("flag_pos", (100 * TILE, 5 * TILE))
+    cam = 0
+    running = True
+    while running:
+        dt = clock.tick(FPS) / 1000.0
+        for e in pygame.event.get():
+            if e.type == QUIT: running = False
+            elif e.type == KEYDOWN and e.key == K_ESCAPE: running = False
+        keys = pygame.key.get_pressed()
+        state.time -= dt
+        if state.time <= 0 and not player.dead:
+            player.dead = True
+            player.death_timer = 3
+            player.vy = JUMP_WALK
+            state.lives -= 1
+        player.update(keys, tmap, enemies, items, dt)
+        if player.dead and player.death_timer <= 0:
+            if state.lives <= 0: running = False
+            else:
+                state.time = 400
+                player = Player(ps[0], ps[1])
+                enemies = [create_enemy(e["type"], e["x"], e["y"]) for e in level.get("enemies", [])]
+        for e in enemies:
+            if e.active: e.update(tmap, dt)
+        for item in items:
+            if item.active: item.update(tmap, dt)
+        for eff in effects[:]:
+            eff.update(dt)
+            if not eff.active: effects.remove(eff)
+        cam += (player.x - WIDTH // 3 - cam) * 0.1
+        cam = max(0, min(cam, tmap.width - WIDTH))
+        if not player.victory and player.x >= flag_pos[0] - 20:
+            player.victory = True
+            state.score += int(state.time) * 50
+        tmap.draw(screen, cam)
+        fx = flag_pos[0] - cam
+        fy = flag_pos[1]
+        pygame.draw.rect(screen, PAL[0], (fx + 6, fy, 4, TILE * 9))
+        pygame.draw.polygon(screen, PAL[22], [(fx + 10, fy + 4), (fx + 34, fy + 16), (fx + 10, fy + 28)])
+        for e in enemies: e.draw(screen, cam)
+        for item in items: item.draw(screen, cam)
+        for eff in effects: eff.draw(screen, cam)
+        player.draw(screen, cam)
+        font = pygame.font.SysFont(None, 24)
+        screen.blit(font.render(f"SCORE: {{state.score:06d}}", True, PAL[32]), (10, 10))
+        screen.blit(font.render(f"COINS: {{state.coins:02d}}", True, PAL[32]), (200, 10))
+        screen.blit(font.render(f"TIME: {{int(max(0, state.time)):03d}}", True, PAL[32]), (350, 10))
+        screen.blit(font.render(f"LIVES: {{state.lives}}", True, PAL[32]), (480, 10))
+        if player.victory:
+            screen.blit(font.render("LEVEL COMPLETE!", True, PAL[32]), (WIDTH//2 - 80, HEIGHT//2))
+        pygame.display.flip()
+        if player.victory and player.x > tmap.width: running = False
+    pygame.quit()
+    print(f"Final Score: {{state.score}}")
+
+if __name__ == "__main__":
+    main()
+'''
+        
+    if not baked:
+        with open(path, "w") as f:
+            f.write(game_code)
+        return
+    code = compile(game_code, "__main__.py", "exec", optimize=2)
+    pyc = importlib.util.MAGIC_NUMBER + bytes(12) + marshal.dumps(code)
+    with open(path, "wb") as f:
+        f.write(b"#!/usr/bin/env python3\n")
+        with zipfile.ZipFile(f, "w", zipfile.ZIP_DEFLATED) as z:
+            z.writestr("__main__.pyc", pyc)
+    os.chmod(path, 0o755)
+
+# ╔═══════════════════════════════════════════════════════════════════════════════╗
+# ║ BENCHMARK                                                                     ║
+# ╚═══════════════════════════════════════════════════════════════════════════════╝
+BENCH_METRICS = ("build_ms", "respawn_ms", "update_mean_ms", "update_p95_ms", "draw_mean_ms", "draw_p95_ms")
+# Medians are what regressions are judged on; means and p95s are too noisy on shared machines
+BENCH_COMPARE = ("build_p50_ms", "respawn_p50_ms", "update_p50_ms", "draw_p50_ms")
+
+def _stats(samples):
+    ms = sorted(s * 1000 for s in samples)
+    pick = lambda q: ms[min(len(ms) - 1, int(len(ms) * q))]
+    return sum(ms) / len(ms), pick(0.50), pick(0.95)
+
+def benchmark_levels(frames=600, draw_frames=240, builds=15, worlds=range(1, 9), levels=range(1, 5), archive=None):
+    """Time level construction, headless updates and TileMap.draw for every world/level, taking
+    levels from archive where it has them"""
+    engine = KoopaEngine(headless=True, archive=archive)
+    surf = pygame.Surface((WIDTH, HEIGHT)).convert()
+    results = {}
+    for w in worlds:
+        for l in levels:
+            r = {}
+            name = f"{w}-{l}"
+            if engine.archive is not None and name in engine.archive:
+                source = lambda: engine.archive.get(name)
+            else:
+                source = lambda: generate_level(w, l)
+            # Construction: generate_level (or archive decode) + TileMap
+            samples = []
+            for _ in range(builds):
+                t = time.perf_counter()
+                TileMap(source(), [], [])
+                samples.append(time.perf_counter() - t)
+            r["build_ms"], r["build_p50_ms"], _ = _stats(samples)
             
-    def _draw_palette(self):
-        pygame.draw.rect(self.screen, PAL[0], (0, HEIGHT - 60, WIDTH, 60))
-        
-        font = pygame.font.SysFont("arial", 14)
-        cat = PAL_CATS[self.pal_cat]
-        
-        # Category tabs
-        for i, c in enumerate(PAL_CATS):
-            color = PAL[32] if i == self.pal_cat else PAL[45]
-            text = font.render(c.upper(), True, color)
-            self.screen.blit(text, (10 + i * 100, HEIGHT - 58))
+            # Respawn: reloading the level from the engine's pristine-map cache
+            state.reset()
+            engine._start_level(w, l)
+            samples = []
+            for _ in range(builds):
+                t = time.perf_counter()
+                engine._load_level(*engine._level(w, l))
+                samples.append(time.perf_counter() - t)
+            r["respawn_ms"], r["respawn_p50_ms"], _ = _stats(samples)
             
-        # Items
-        items = PALETTE[cat]
-        for i, (item_id, name) in enumerate(items):
-            x = 10 + i * 55
-            y = HEIGHT - 38
-            if i == self.pal_idx:
-                pygame.draw.rect(self.screen, PAL[32], (x - 2, y - 2, 24, 24), 2)
-            self._draw_pal_item(x, y, item_id, cat)
+            # Headless update with scripted input
+            state.reset()
+            engine._start_level(w, l)
+            engine.script = autoplay
+            for _ in range(30):
+                engine.step()
+            samples = []
+            gc0 = gc.get_stats()[0]["collections"]
+            for _ in range(frames):
+                t = time.perf_counter()
+                engine.step()
+                samples.append(time.perf_counter() - t)
+                if engine.mode != "game":
+                    engine._start_level(w, l)
+            r["update_mean_ms"], r["update_p50_ms"], r["update_p95_ms"] = _stats(samples)
+            r["gc_gen0"] = gc.get_stats()[0]["collections"] - gc0
             
-        # Name
-        if items:
-            n = items[self.pal_idx][1]
-            nt = font.render(n, True, PAL[32])
-            self.screen.blit(nt, (WIDTH - 130, HEIGHT - 30))
+            # Allocations over the same kind of run
+            state.reset()
+            engine._start_level(w, l)
+            tracemalloc.start()
+            for _ in range(min(frames, 240)):
+                engine.step()
+                if engine.mode != "game":
+                    engine._start_level(w, l)
+            r["alloc_peak_kb"] = tracemalloc.get_traced_memory()[1] / 1024
+            tracemalloc.stop()
+            engine.script = None
             
-        # Theme indicator
-        ti = font.render(f"Theme: {self.edit_lv.theme}", True, PAL[45])
-        self.screen.blit(ti, (WIDTH - 130, HEIGHT - 50))
-        
-    def _draw_pal_item(self, x, y, item_id, cat):
-        if cat == "terrain":
-            if item_id == "G":
-                pygame.draw.rect(self.screen, PAL[23], (x, y, 20, 20))
-                pygame.draw.rect(self.screen, PAL[26], (x, y, 20, 4))
-            elif item_id == "D":
-                pygame.draw.rect(self.screen, PAL[22], (x, y, 20, 20))
-            elif item_id == "P":
-                pygame.draw.rect(self.screen, PAL[23], (x, y, 20, 20))
-                pygame.draw.rect(self.screen, PAL[0], (x+2, y+2, 16, 16))
-            elif item_id == "T":
-                pygame.draw.rect(self.screen, PAL[26], (x, y, 20, 20))
-            elif item_id == " ":
-                pygame.draw.rect(self.screen, PAL[32], (x, y, 20, 20), 1)
-                pygame.draw.line(self.screen, PAL[22], (x, y), (x+20, y+20))
-        elif cat == "blocks":
-            if item_id == "B":
-                pygame.draw.rect(self.screen, PAL[22], (x, y, 20, 20))
-                pygame.draw.rect(self.screen, PAL[0], (x, y+9, 20, 2))
-                pygame.draw.rect(self.screen, PAL[0], (x+9, y, 2, 20))
-            elif item_id in ("?", "?C", "?M"):
-                pygame.draw.rect(self.screen, PAL[39], (x, y, 20, 20))
-                pygame.draw.rect(self.screen, PAL[40], (x+4, y+4, 12, 12))
-        elif cat == "enemies":
-            if item_id == "goomba":
-                pygame.draw.ellipse(self.screen, GOOMBA, (x+2, y+4, 16, 14))
-            elif item_id == "koopa":
-                pygame.draw.ellipse(self.screen, KOOPA_G, (x+2, y+4, 16, 14))
-            elif item_id == "piranha":
-                pygame.draw.ellipse(self.screen, PAL[22], (x+2, y+6, 16, 12))
-        elif cat == "special":
-            if item_id == "player":
-                pygame.draw.rect(self.screen, PAL[22], (x+4, y+2, 12, 16))
-            elif item_id == "flag":
-                pygame.draw.rect(self.screen, PAL[0], (x+8, y+2, 3, 18))
-                pygame.draw.polygon(self.screen, PAL[22], [(x+11, y+4), (x+20, y+8), (x+11, y+12)])
-                
-    def _draw_help(self):
-        ov = pygame.Surface((WIDTH, HEIGHT))
-        ov.fill((0, 0, 0))
-        ov.set_alpha(220)
-        self.screen.blit(ov, (0, 0))
-        
-        font = pygame.font.SysFont("arial", 16)
-        lines = [
-            "═══ KOOPA ENGINE EDITOR ═══",
-            "",
-            "Left Click: Place tile/enemy",
-            "Right Click: Erase",
-            "Mouse Wheel: Scroll palette",
-            "1-4: Switch categories",
-            "WASD/Arrows: Pan camera",
-            "",
-            "E / TAB: Play test level",
-            "G: Toggle grid",
-            "T: Change theme (1-8)",
-            "H: Toggle this help",
-            "",
-            "Ctrl+S: Save level (.kpl)",
-            "Ctrl+E: Export standalone game (.py)",
-            "Ctrl+Z: Undo | Ctrl+Y: Redo",
-            "Ctrl+N: New level",
-            "",
-            "ESC: Back to title"
-        ]
-        
-        for i, line in enumerate(lines):
-            color = PAL[39] if i == 0 else PAL[32]
-            t = font.render(line, True, color)
-            self.screen.blit(t, (WIDTH//2 - t.get_width()//2, 25 + i * 22))
+            # Offscreen TileMap.draw sweeping the camera across the level
+            tmap = TileMap(source(), [], [])
+            span = max(1, tmap.width - WIDTH)
+            samples = []
+            for i in range(draw_frames):
+                cam = span * i / draw_frames
+                t = time.perf_counter()
+                tmap.draw(surf, cam)
+                samples.append(time.perf_counter() - t)
+            r["draw_mean_ms"], r["draw_p50_ms"], r["draw_p95_ms"] = _stats(samples)
+            results[f"{w}-{l}"] = r
+    return {
+        "meta": {"frames": frames, "draw_frames": draw_frames, "python": sys.version.split()[0],
+                 "pygame": pygame.version.ver, "archive": archive, "date": datetime.datetime.now().isoformat(timespec="seconds")},
+        "levels": results,
+    }
+
+def compare_benchmark(current, baseline, threshold=0.25, floor_ms=0.02):
+    """Regressions where a median grew by more than threshold (and floor_ms) over the baseline"""
+    regressions = []
+    for name, r in current["levels"].items():
+        base = baseline["levels"].get(name)
+        if base is None:
+            continue
+        for metric in BENCH_COMPARE:
+            old, new = base.get(metric), r.get(metric)
+            if old is None or new is None:
+                continue
+            if new > old * (1 + threshold) and new - old > floor_ms:
+                regressions.append((name, metric, old, new))
+    return regressions
+
+# ╔═══════════════════════════════════════════════════════════════════════════════╗
+# ║ SEED SWEEP                                                                    ║
+# ╚═══════════════════════════════════════════════════════════════════════════════╝
+SWEEP_TOP_K = 20
+SWEEP_CHUNK = 2000
+
+def _sweep_chunk(world, level, start, stop, top):
+    """Worker: score seeds [start, stop) and return the best top of them"""
+    best = []
+    for seed in range(start, stop):
+        data = generate_level(world, level, seed)
+        m = level_metrics(data, solve=False)
+        entry = (level_score(m), -seed, m)
+        if len(best) == top and entry <= best[0]:
+            continue
+        # Only levels that would make the cut pay for the solvability search
+        m["reachable"] = analyze_level(data)["solvable"]
+        if not m["reachable"]: continue
+        if len(best) < top:
+            heapq.heappush(best, entry)
+        elif entry > best[0]:
+            heapq.heapreplace(best, entry)
+    return world, level, best
+
+def sweep_seeds(worlds, levels, seeds, top=SWEEP_TOP_K, workers=None, chunk=SWEEP_CHUNK):
+    """Top-scoring seeds per world-level, scored in parallel over every core"""
+    results = {f"{w}-{l}": [] for w in worlds for l in levels}
+    with ProcessPoolExecutor(workers) as pool:
+        jobs = [pool.submit(_sweep_chunk, w, l, s, min(s + chunk, seeds.stop), top)
+                for w in worlds for l in levels for s in range(seeds.start, seeds.stop, chunk)]
+        for job in as_completed(jobs):
+            w, l, best = job.result()
+            key = f"{w}-{l}"
+            merged = [(e["score"], -e["seed"], e) for e in results[key]] + best
+            results[key] = [dict(m, seed=-neg, score=score) for score, neg, m in heapq.nlargest(top, merged)]
+    return results
+
+def save_sweep(results, path, top=SWEEP_TOP_K, meta=None):
+    """Merge results into the JSON results file at path, keeping the best top seeds per world-level"""
+    index = {"meta": {}, "levels": {}}
+    if os.path.exists(path):
+        with open(path) as f:
+            index = json.load(f)
+    for key, entries in results.items():
+        seen = {e["seed"]: e for e in index["levels"].get(key, [])}
+        seen.update((e["seed"], e) for e in entries)
+        index["levels"][key] = sorted(seen.values(), key=lambda e: (-e["score"], e["seed"]))[:top]
+    index["meta"].update(meta or {})
+    with open(path, "w") as f:
+        json.dump(index, f, indent=1, sort_keys=True)
+    return index
+
+# ╔═══════════════════════════════════════════════════════════════════════════════╗
+# ║ BATCH                                                                         ║
+# ╚═══════════════════════════════════════════════════════════════════════════════╝
+BATCH_CHUNK = 8
+_batch_archives = {}
+
+def batch_jobs(sources=(), worlds=range(1, 2), levels=range(1, 2), seeds=None):
+    """(name, source) jobs for batch_levels: every .kpl in a directory, a .kpl file, every level of
+    a .kpa archive, and each world-level slot per seed. Only archive indexes are read here. Names
+    are made unique (L1, L1_2, ...) as they name the preview and export files"""
+    jobs = []
+    for src in sources:
+        if os.path.isdir(src):
+            for fn in sorted(os.listdir(src)):
+                if fn.endswith(".kpl"):
+                    jobs.append((fn[:-4], ("kpl", os.path.join(src, fn))))
+        elif src.endswith(".kpa"):
+            archive = LevelArchive(src)
+            stem = os.path.splitext(os.path.basename(src))[0]
+            jobs.extend((f"{stem}_{name}", ("kpa", src, name)) for name in archive.names())
+            archive.close()
+        else:
+            jobs.append((os.path.splitext(os.path.basename(src))[0], ("kpl", src)))
+    for seed in seeds or ():
+        jobs.extend((f"{w}-{l}_s{seed}", ("seed", w, l, seed)) for w in worlds for l in levels)
+    taken = set()
+    for i, (name, source) in enumerate(jobs):
+        unique, n = name, 1
+        while unique in taken:
+            n += 1
+            unique = f"{name}_{n}"
+        taken.add(unique)
+        jobs[i] = (unique, source)
+    return jobs
+
+def _batch_load(source):
+    if source[0] == "seed":
+        return generate_level(*source[1:])
+    if source[0] == "kpa":
+        # One mapping per archive per worker process, reused by every job it runs
+        archive = _batch_archives.get(source[1])
+        if archive is None:
+            archive = _batch_archives[source[1]] = LevelArchive(source[1])
+        return archive.get(source[2])
+    return load_kpl(source[1])
+
+def render_preview(data, scale=0.5, furthest=None):
+    """The whole level on one surface: tiles, enemies, start and flag, with a line at the furthest
+    column analyze_level reached when that is short of the goal"""
+    rows = level_rows(data["tiles"])
+    theme = THEMES.get(data.get("theme", 1), THEMES[1])
+    atlas = tile_atlas(data.get("theme", 1))
+    surf = pygame.Surface((len(rows[0]) * TILE, len(rows) * TILE))
+    surf.fill(PAL[theme["sky"]])
+    for y, row in enumerate(rows):
+        for x, c in enumerate(row):
+            sprite = atlas.get(chr(c))
+            if sprite is not None:
+                surf.blit(sprite, (x * TILE, y * TILE))
+    for e in data.get("enemies", []):
+        create_enemy(e["type"], e["x"], e["y"]).draw(surf, 0)
+    fx, fy = data["flag_pos"]
+    pygame.draw.rect(surf, PAL[0], (fx + 6, fy, 4, TILE * 9))
+    pygame.draw.polygon(surf, PAL[22], [(fx + 10, fy + 4), (fx + 34, fy + 16), (fx + 10, fy + 28)])
+    px, py = data["player_start"]
+    pygame.draw.rect(surf, MARIO_R, (int(px), int(py), 16, 16))
+    if furthest is not None:
+        pygame.draw.rect(surf, PAL[22], (furthest * TILE + TILE, 0, 2, surf.get_height()))
+    if scale != 1:
+        surf = pygame.transform.scale(surf, (max(1, int(surf.get_width() * scale)), max(1, int(surf.get_height() * scale))))
+    return surf
+
+def _batch_level(name, source, out_dir, export=None, scale=0.5):
+    """Worker: load, validate, preview and optionally export one level; a level that fails at any
+    stage (a missing file, a corrupt or incomplete level) is reported with that stage, not raised,
+    so one bad file doesn't stop the batch"""
+    entry = {"name": name, "source": list(source)}
+    ms = {}
+    stage = "load"
+    try:
+        t = time.perf_counter()
+        data = _batch_load(source)
+        ms["load"] = (time.perf_counter() - t) * 1000
+        stage = "validate"
+        t = time.perf_counter()
+        reach = analyze_level(data)
+        entry.update(level_metrics(data, solve=False), reachable=reach["solvable"], furthest=reach["furthest"], goal=reach["goal"])
+        ms["validate"] = (time.perf_counter() - t) * 1000
+        stage = "preview"
+        t = time.perf_counter()
+        entry["preview"] = os.path.join(out_dir, "previews", name + ".png")
+        pygame.image.save(render_preview(data, scale, None if entry["reachable"] else reach["furthest"]), entry["preview"])
+        ms["preview"] = (time.perf_counter() - t) * 1000
+        if export:
+            stage = "export"
+            t = time.perf_counter()
+            entry["export"] = os.path.join(out_dir, "games", name + (".pyz" if export == "baked" else ".py"))
+            export_game(data, entry["export"], baked=export == "baked")
+            ms["export"] = (time.perf_counter() - t) * 1000
+    except (OSError, ValueError, SyntaxError, KeyError, TypeError, IndexError, pygame.error) as e:
+        return {"name": name, "source": list(source), "error": f"{stage}: {type(e).__name__}: {e}"}
+    ms["total"] = sum(ms.values())
+    entry["ms"] = ms
+    return entry
+
+def _batch_chunk(jobs, out_dir, export, scale):
+    return [_batch_level(name, source, out_dir, export, scale) for name, source in jobs]
+
+def batch_levels(jobs, out_dir, export=None, scale=0.5, workers=None, chunk=BATCH_CHUNK):
+    """Run _batch_level over jobs on every core and write manifest.json (per-level results and
+    timings, plus totals) to out_dir; export is None, "py" or "baked". Returns the manifest"""
+    os.makedirs(os.path.join(out_dir, "previews"), exist_ok=True)
+    if export:
+        os.makedirs(os.path.join(out_dir, "games"), exist_ok=True)
+    t = time.perf_counter()
+    results = {}
+    with ProcessPoolExecutor(workers) as pool:
+        futures = {pool.submit(_batch_chunk, jobs[i:i + chunk], out_dir, export, scale): i
+                   for i in range(0, len(jobs), chunk)}
+        for future in as_completed(futures):
+            for i, entry in enumerate(future.result(), futures[future]):
+                results[i] = entry
+    secs = time.perf_counter() - t
+    entries = [results[i] for i in range(len(jobs)) if i in results]
+    done = [e for e in entries if "error" not in e]
+    manifest = {
+        "meta": {
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "levels": len(entries),
+            "failed": sum("error" in e for e in entries),
+            "unsolvable": sum(not e["reachable"] for e in done),
+            "export": export,
+            "workers": workers or os.cpu_count(),
+            "seconds": round(secs, 3),
+            "levels_per_s": round(len(entries) / secs, 1) if secs else None,
+            # Summed worker time per stage, to see where the batch went
+            "stage_ms": {stage: round(sum(e["ms"].get(stage, 0) for e in done), 1)
+                         for stage in ("load", "validate", "preview", "export", "total")},
+        },
+        "levels": entries,
+    }
+    for e in done:
+        e["ms"] = {stage: round(v, 3) for stage, v in e["ms"].items()}
+    with open(os.path.join(out_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
+
+# ╔═══════════════════════════════════════════════════════════════════════════════╗
+# ║ SELF CHECKS                                                                   ║
+# ╚═══════════════════════════════════════════════════════════════════════════════╝
+CHECK_WALLS = (3, 4, 5)         # tile heights either side of the 56.9 px jump apex
+CHECK_SWEEP_SEEDS = range(40)   # 1-1 seeds the sweep check scores
+CHECK_REJECT_SEED = 3           # one of them walled off by a 4-tile pipe, which the sweep must drop
+
+def wall_level(height, w=40):
+    """Flat ground with one 2-wide pipe of height tiles at column 20 between start and flag"""
+    gy = 13
+    tiles = [bytearray(b" " * w) for _ in range(gy)] + [bytearray(b"G" * w), bytearray(b"D" * w)]
+    for y in range(gy - height, gy):
+        tiles[y][20:22] = b"TT"
+    return {"tiles": [row.decode() for row in tiles], "enemies": [], "player_start": (3 * TILE, (gy - 1) * TILE),
+            "flag_pos": ((w - 4) * TILE, (gy - 9) * TILE), "width": w * TILE, "theme": 1}
+
+def physics_crosses(data, x, frames=300):
+    """Whether any of 720 scripted runs (walk or run right, one jump at some frame, held for some
+    frames) takes the real small Player past pixel x"""
+    state.powerup = 0
+    tmap = TileMap(data, [], [])
+    keys = ScriptedKeys()
+    for run in (0, IN_RUN):
+        for jump_at in range(0, 120, 2):
+            for hold in (1, 4, 8, 12, 15, 30):
+                p = Player(*data["player_start"])
+                for f in range(frames):
+                    keys.mask = IN_RIGHT | run | (IN_JUMP if jump_at <= f < jump_at + hold else 0)
+                    p.update(keys, tmap, [], [], SIM_DT)
+                    if p.x > x:
+                        return True
+                    if p.dead:
+                        break
+    return False
+
+def check_wall_jumps(heights=CHECK_WALLS):
+    """analyze_level against the real physics on a pipe of each height: [(height, analyzer, physics)]"""
+    results = []
+    for height in heights:
+        data = wall_level(height)
+        results.append((height, analyze_level(data)["solvable"], physics_crosses(data, 22 * TILE)))
+    return results
+
+def check_sweep(seeds=CHECK_SWEEP_SEEDS, reject=CHECK_REJECT_SEED):
+    """sweep_seeds on 1-1 with room for every seed, so each pays for the solvability filter: [(what,
+    ok)] for matching a serial run, keeping just the seeds analyze_level solves, dropping reject,
+    and the real physics being blocked too at the first pipe past where reject's analysis stops"""
+    top = len(seeds)
+    parallel = [e["seed"] for e in sweep_seeds(range(1, 2), range(1, 2), seeds, top, 2, top // 2)["1-1"]]
+    _, _, best = _sweep_chunk(1, 1, seeds.start, seeds.stop, top)
+    serial = [-neg for _, neg, _ in sorted(best, reverse=True)]
+    solvable = {seed for seed in seeds if analyze_level(generate_level(1, 1, seed))["solvable"]}
+    data = generate_level(1, 1, reject)
+    rows = level_rows(data["tiles"])
+    gy = len(rows) - 2
+    pipe = rows[gy - 1].index(b"T", analyze_level(data)["furthest"])
+    c0, c1 = pipe - 20, pipe + 12
+    window = {"tiles": [row[c0:c1].decode() for row in rows], "enemies": [],
+              "player_start": (3 * TILE, (gy - 1) * TILE), "flag_pos": ((c1 - c0 - 2) * TILE, 4 * TILE),
+              "width": (c1 - c0) * TILE, "theme": 1}
+    crosses = physics_crosses(window, (pipe - c0 + 2) * TILE)
+    return [("parallel sweep matches a serial one", parallel == serial),
+            ("sweep keeps exactly the seeds analyze_level solves", set(serial) == solvable),
+            (f"sweep drops seed {reject}", reject in seeds and reject not in serial),
+            (f"physics blocked too at seed {reject}'s pipe in column {pipe}", not crosses)]
+
+def piranha_level(w=120):
+    """Flat ground with a 2-tile pipe every 12 columns from column 20, a piranha plant in each"""
+    gy = 13
+    tiles = [bytearray(b" " * w) for _ in range(gy)] + [bytearray(b"G" * w), bytearray(b"D" * w)]
+    pipes = range(20, w - 12, 12)
+    for x in pipes:
+        tiles[gy - 2][x:x + 2] = tiles[gy - 1][x:x + 2] = b"TT"
+    return {"tiles": [row.decode() for row in tiles],
+            "enemies": [{"x": x * TILE + 8, "y": (gy - 2) * TILE, "type": "piranha"} for x in pipes],
+            "player_start": (3 * TILE, (gy - 1) * TILE), "flag_pos": ((w - 4) * TILE, (gy - 9) * TILE),
+            "width": w * TILE, "theme": 1}
+
+def replay_end(engine):
+    """What a replay must reproduce: score, lives, the player and every live enemy"""
+    p = engine.player
+    return (state.score, state.lives, p.x, p.y, p.dead,
+            [(type(e).__name__, e.x, e.y, getattr(e, "timer", None)) for e in engine.enemies])
+
+def check_seedless_replay(frames=600):
+    """Record autoplay on a hand-made (seedless) archived piranha_level, whose plants take their
+    timers from the level's rng, then replay it on a fresh engine: (recorded end, replayed end)"""
+    ends = []
+    with tempfile.TemporaryDirectory() as tmp:
+        archive, path = os.path.join(tmp, "check.kpa"), os.path.join(tmp, "check.krp")
+        LevelArchive.write(archive, {"1-1": piranha_level()})
+        engine = KoopaEngine(headless=True, archive=archive)
+        engine.record_path = path
+        engine.simulate(frames)
+        engine.recording.save(path)
+        ends.append(replay_end(engine))
+        engine.archive.close()
+        engine = KoopaEngine(headless=True, archive=archive)
+        engine.play_replay(Replay.load(path))
+        ends.append(replay_end(engine))
+        engine.archive.close()
+    return ends
 
 # ╔═══════════════════════════════════════════════════════════════════════════════╗
 # ║ MAIN                                                                          ║
 # ╚═══════════════════════════════════════════════════════════════════════════════╝
-if __name__ == "__main__":
+def _int_range(text):
+    """'8' -> range(8, 9), '1-8' -> range(1, 9)"""
+    lo, _, hi = text.partition("-")
+    return range(int(lo), int(hi or lo) + 1)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AC!'s Koopa Engine")
+    sub = parser.add_subparsers(dest="cmd")
+    hp = sub.add_parser("headless", help="fast-forward a level with no window and scripted input")
+    hp.add_argument("--frames", type=int, default=36000)
+    hp.add_argument("--world", type=int, default=1)
+    hp.add_argument("--level", type=int, default=1)
+    hp.add_argument("--seed", type=int, default=None)
+    hp.add_argument("--draw", action="store_true", help="also render every frame offscreen")
+    hp.add_argument("--record", metavar="FILE", help="save the scripted inputs as a replay")
+    hp.add_argument("--archive", metavar="FILE", help="play levels from a .kpa archive")
+    hp.add_argument("--endless", action="store_true", help="soak-test endless mode instead of a level")
+    rp = sub.add_parser("replay", help="re-run a recorded replay headless")
+    rp.add_argument("file")
+    rp.add_argument("--draw", action="store_true", help="also render every frame offscreen")
+    rp.add_argument("--archive", metavar="FILE", help="play levels from this .kpa instead of the recorded one")
+    bp = sub.add_parser("bench", help="benchmark every generated level and write JSON")
+    bp.add_argument("--frames", type=int, default=600)
+    bp.add_argument("--draw-frames", type=int, default=240)
+    bp.add_argument("--out", default="bench.json")
+    bp.add_argument("--baseline", metavar="FILE", help="flag regressions against a saved run")
+    bp.add_argument("--threshold", type=float, default=0.25)
+    bp.add_argument("--archive", metavar="FILE", help="benchmark the levels in a .kpa archive")
+    sp = sub.add_parser("sweep", help="score a seed range on every core and keep the best seeds")
+    sp.add_argument("--worlds", type=_int_range, default=range(1, 9), help="e.g. 1-8 or 3")
+    sp.add_argument("--levels", type=_int_range, default=range(1, 2), help="e.g. 1-4 or 2")
+    sp.add_argument("--seeds", type=int, default=100000, help="number of seeds to try")
+    sp.add_argument("--start", type=int, default=0, help="first seed")
+    sp.add_argument("--top", type=int, default=SWEEP_TOP_K)
+    sp.add_argument("--workers", type=int, default=None, help="processes (default: all cores)")
+    sp.add_argument("--out", default="seeds.json")
+    kp = sub.add_parser("pack", help="pack every world-level slot and custom levels into one archive")
+    kp.add_argument("--worlds", type=_int_range, default=range(1, 9), help="e.g. 1-8 or 3")
+    kp.add_argument("--levels", type=_int_range, default=range(1, 5), help="e.g. 1-4 or 2")
+    kp.add_argument("--seeds", metavar="FILE", help="sweep results to take each slot's best seed from")
+    kp.add_argument("--custom", metavar="DIR", default="levels", help="directory of .kpl levels to add")
+    kp.add_argument("--out", default=LEVEL_ARCHIVE)
+    tp = sub.add_parser("batch", help="validate, preview and export many levels on every core")
+    tp.add_argument("sources", nargs="*", help="directories of .kpl levels, .kpl files or .kpa archives")
+    tp.add_argument("--seeds", type=_int_range, default=None, help="also generate these seeds, e.g. 0-99")
+    tp.add_argument("--worlds", type=_int_range, default=range(1, 2), help="world(s) for --seeds, e.g. 1-8")
+    tp.add_argument("--levels", type=_int_range, default=range(1, 2), help="level(s) for --seeds, e.g. 1-4")
+    tp.add_argument("--export", choices=("py", "baked"), help="also write a standalone game per level")
+    tp.add_argument("--scale", type=float, default=0.5, help="preview size relative to the level")
+    tp.add_argument("--workers", type=int, default=None, help="processes (default: all cores)")
+    tp.add_argument("--out", default="batch", help="directory for previews, games and manifest.json")
+    sub.add_parser("check", help="check the level analyzer against the real physics, the sweep and replays")
+    parser.add_argument("--record", metavar="FILE", help="record the session's inputs to a replay file")
+    parser.add_argument("--archive", metavar="FILE", default=LEVEL_ARCHIVE, help="levels to play, if the file exists")
+    args = parser.parse_args(argv)
+    
+    if args.cmd == "sweep":
+        seeds = range(args.start, args.start + args.seeds)
+        t = time.perf_counter()
+        results = sweep_seeds(args.worlds, args.levels, seeds, args.top, args.workers)
+        secs = time.perf_counter() - t
+        total = len(seeds) * len(args.worlds) * len(args.levels)
+        index = save_sweep(results, args.out, args.top, {"date": datetime.datetime.now().isoformat(timespec="seconds")})
+        for key in results:
+            best = index["levels"][key][:3]
+            print(f"{key:<6}" + "  ".join(f"seed {e['seed']} ({e['score']})" for e in best))
+        print(f"{total} levels in {secs:.1f}s = {total / secs:.0f} levels/s | wrote {args.out}")
+        return
+    if args.cmd == "batch":
+        try:
+            jobs = batch_jobs(args.sources, args.worlds, args.levels, args.seeds)
+        except (OSError, ValueError) as e:
+            parser.error(f"batch: {e}")
+        if not jobs:
+            parser.error("batch: give level sources and/or --seeds")
+        manifest = batch_levels(jobs, args.out, args.export, args.scale, args.workers)
+        for e in manifest["levels"]:
+            if "error" in e:
+                print(f"{e['name']:<20}FAILED {e['error']}")
+            elif not e["reachable"]:
+                print(f"{e['name']:<20}UNSOLVABLE (stuck at column {e['furthest']} of {e['goal']})")
+        meta = manifest["meta"]
+        print(f"{meta['levels']} levels in {meta['seconds']:.1f}s = {meta['levels_per_s']} levels/s | "
+              f"{meta['failed']} failed, {meta['unsolvable']} unsolvable | wrote {os.path.join(args.out, 'manifest.json')}")
+        sys.exit(1 if meta["failed"] or meta["unsolvable"] else 0)
+    if args.cmd == "check":
+        failed = 0
+        for height, solvable, crosses in check_wall_jumps():
+            ok = solvable == crosses
+            failed += not ok
+            print(f"{'ok' if ok else 'FAIL':<6}{height}-tile pipe: analyzer {'solvable' if solvable else 'blocked'}, "
+                  f"physics {'crosses' if crosses else 'blocked'}")
+        for what, ok in check_sweep():
+            failed += not ok
+            print(f"{'ok' if ok else 'FAIL':<6}1-1 seed sweep: {what}")
+        recorded, replayed = check_seedless_replay()
+        failed += recorded != replayed
+        print(f"{'ok' if recorded == replayed else 'FAIL':<6}seedless archived piranha level: replay "
+              f"{'matches' if recorded == replayed else 'diverges from'} the recording")
+        sys.exit(1 if failed else 0)
+    if args.cmd == "pack":
+        t = time.perf_counter()
+        custom = args.custom if os.path.isdir(args.custom) else None
+        levels = pack_levels(args.worlds, args.levels, args.seeds, custom)
+        size = LevelArchive.write(args.out, levels)
+        print(f"{len(levels)} levels, {size / 1024:.1f} KB in {time.perf_counter() - t:.2f}s | wrote {args.out}")
+        return
+    
+    if args.cmd == "headless" and args.endless:
+        engine = KoopaEngine(headless=True)
+        r = engine.soak_endless(args.frames, args.world, args.seed or 0, draw=args.draw)
+        print(f"{r['frames']} frames in {r['seconds']:.2f}s = {r['fps']:.0f} sim frames/s "
+              f"(+{r['planning']:.1f}s pilot planning) | {r['distance']} columns"
+              + (f", STUCK at column {r['stuck']}" if r["stuck"] is not None else ""))
+        print("peak live " + ", ".join(f"{name} {n}" for name, n in r["peak"].items()))
+        print(f"step mean: first tenth {r['first_ms']:.3f} ms, last tenth {r['last_ms']:.3f} ms")
+        pygame.quit()
+        sys.exit(1 if r["stuck"] is not None else 0)
+    if args.cmd == "headless":
+        engine = KoopaEngine(headless=True, archive=args.archive)
+        engine.record_path = args.record
+        r = engine.simulate(args.frames, args.world, args.level, draw=args.draw, seed=args.seed)
+        engine._save_recording()
+        print(f"{r['frames']} frames in {r['seconds']:.2f}s = {r['fps']:.0f} sim frames/s")
+        pygame.quit()
+        return
+    if args.cmd == "bench":
+        res = benchmark_levels(args.frames, args.draw_frames, archive=args.archive)
+        with open(args.out, "w") as f:
+            json.dump(res, f, indent=1)
+        print(f"{'level':<6}" + "".join(f"{m:>16}" for m in BENCH_METRICS + ("alloc_peak_kb",)))
+        for name, r in res["levels"].items():
+            print(f"{name:<6}" + "".join(f"{r[m]:>16.3f}" for m in BENCH_METRICS + ("alloc_peak_kb",)))
+        print(f"Wrote {args.out}")
+        pygame.quit()
+        if args.baseline:
+            with open(args.baseline) as f:
+                regressions = compare_benchmark(res, json.load(f), args.threshold)
+            for name, metric, old, new in regressions:
+                print(f"REGRESSION {name} {metric}: {old:.3f} -> {new:.3f} ms")
+            print(f"{len(regressions)} regression(s) vs {args.baseline}")
+            sys.exit(1 if regressions else 0)
+        return
+    if args.cmd == "replay":
+        rep = Replay.load(args.file)
+        archive = args.archive or rep.archive
+        if archive and not os.path.exists(archive):
+            parser.error(f"replay: {args.file} plays levels from {archive}, which is missing; pass --archive")
+        engine = KoopaEngine(headless=True, archive=archive)
+        try:
+            r = engine.play_replay(rep, draw=args.draw)
+        except ValueError as e:
+            parser.error(f"replay: {args.file}: {e}")
+        print(f"{r['frames']} frames in {r['seconds']:.2f}s = {r['fps']:.0f} sim frames/s | "
+              f"world {r['world']}-{r['level']} score {r['score']}")
+        pygame.quit()
+        return
+        
     print("╔" + "═" * 58 + "╗")
     print("║" + "  AC!'s KOOPA ENGINE 1.1".center(58) + "║")
     print("║" + "  SMB1 Accurate + Lunar Magic Editor".center(58) + "║")
@@ -2001,5 +4259,9 @@ if __name__ == "__main__":
     print("║" + "    Ctrl+E: Export game | Ctrl+S: Save level".ljust(58) + "║")
     print("╚" + "═" * 58 + "╝")
     
-    engine = KoopaEngine()
+    engine = KoopaEngine(archive=args.archive if os.path.exists(args.archive) else None)
+    engine.record_path = args.record
     engine.run()
+
+if __name__ == "__main__":
+    main()